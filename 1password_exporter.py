@@ -16,9 +16,1143 @@ import csv
 import os
 import sys
 import re
+import hashlib
+import ipaddress
+import zlib
+import time
+import bisect
+import shutil
+import sqlite3
+import tempfile
+import threading
+import uuid
+import base64
+from xml.sax.saxutils import escape as xml_escape
+from html import escape as html_escape
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Callable, Iterator, BinaryIO
+from urllib.parse import urlsplit
+
+
+class CredentialIndex:
+    """Linear-time index of Login credentials for duplicate and reuse detection.
+
+    Every credential is hashed into three dictionaries as it is written, so
+    duplicates are found with one lookup per item instead of comparing pairs:
+      - exact:     (host, username, password) - the same login stored twice
+      - accounts:  (base domain, username)    - near-duplicates (other subdomain or password)
+      - passwords: password                   - the same password reused across logins
+    Passwords are only held as keyed digests with a per-run random key. The dictionaries
+    are SpillDicts keyed by the NUL-joined key parts, so they move to disk under the
+    governor's memory limit.
+    """
+
+    def __init__(self, governor: "MemoryGovernor"):
+        self._hash_key = os.urandom(16)
+        self.exact = SpillDict(governor, "credentials_exact")
+        self.accounts = SpillDict(governor, "credentials_accounts")
+        self.passwords = SpillDict(governor, "credentials_passwords")
+
+    @staticmethod
+    def normalize_host(url: str) -> str:
+        """Reduce a URL to its lowercase host without scheme, port or leading www."""
+        url = url.strip().lower()
+        if not url:
+            return ""
+        if "://" not in url:
+            url = f"//{url}"
+        try:
+            host = urlsplit(url).hostname or ""
+        except ValueError:
+            host = ""
+        return host[4:] if host.startswith("www.") else host
+
+    # Second-level labels that country-code TLDs use as public suffixes (co.uk, com.au, ne.jp)
+    SECOND_LEVEL_SUFFIXES = {"ac", "co", "com", "edu", "go", "gob", "gov", "ltd", "me", "ne", "net",
+                             "nom", "or", "org", "plc", "sch"}
+
+    @classmethod
+    def base_domain(cls, host: str) -> str:
+        """Return the registrable domain of a host (accounts.example.com -> example.com,
+        shop.amazon.co.uk -> amazon.co.uk). IP addresses are returned whole."""
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            pass
+        labels = host.split(".")
+        keep = 2
+        if len(labels[-1]) == 2 and len(labels) > 2 and labels[-2] in cls.SECOND_LEVEL_SUFFIXES:
+            keep = 3
+        return ".".join(labels[-keep:]) if len(labels) > keep else host
+
+    def password_digest(self, password: str) -> str:
+        """Hash a password with the per-run key so it never sits in the index in plain text."""
+        return hashlib.blake2b(password.encode("utf-8"), key=self._hash_key, digest_size=16).hexdigest()
+
+    def make_key(self, url: str, username: str, password: str) -> Tuple[str, str, str]:
+        """Build the (host, username, password digest) key for a credential."""
+        digest = self.password_digest(password) if password else ""
+        return (self.normalize_host(url), username.strip().lower(), digest)
+
+    @staticmethod
+    def storage_key(key: Tuple[str, ...]) -> str:
+        """Key parts joined with NUL, which hosts and digests never contain."""
+        return "\0".join(key)
+
+    def find_exact(self, key: Tuple[str, str, str]) -> Optional[str]:
+        """Return the title of an earlier credential with the same key, if any."""
+        titles = self.exact.get(self.storage_key(key))
+        return titles[0] if titles else None
+
+    def add(self, title: str, key: Tuple[str, str, str]):
+        """Index a credential under all three keys."""
+        host, user, digest = key
+
+        if digest:
+            self.passwords.append(digest, title)
+
+        # Without a host or username there is nothing to identify the account by
+        if not host and not user:
+            return
+
+        exact_key = self.storage_key(key)
+        if exact_key in self.exact:
+            self.exact.append(exact_key, title)
+            return
+        self.exact[exact_key] = [title]
+
+        self.accounts.append(self.storage_key((self.base_domain(host), user)), exact_key)
+
+    def duplicate_groups(self) -> List[Tuple[str, str, List[str]]]:
+        """Return (type, key, titles) for every exact duplicate, near-duplicate and reused password."""
+        groups = []
+
+        for exact_key, titles in self.exact.items():
+            if len(titles) > 1:
+                host, rest = exact_key.split("\0", 1)
+                user = rest.rsplit("\0", 1)[0]
+                groups.append(("exact_duplicate", f"{host} / {user}", titles))
+
+        for account_key, exact_keys in self.accounts.items():
+            if len(exact_keys) > 1:
+                domain, user = account_key.split("\0", 1)
+                titles = [self.exact[key][0] for key in exact_keys]
+                groups.append(("near_duplicate", f"{domain} / {user}", titles))
+
+        reuse_number = 0
+        for titles in self.passwords.values():
+            if len(titles) > 1:
+                reuse_number += 1
+                groups.append(("reused_password", f"password #{reuse_number}", titles))
+
+        return groups
+
+    def close(self):
+        for index in (self.exact, self.accounts, self.passwords):
+            index.close()
+
+
+class ShardedCsvWriter:
+    """Write QUOTE_ALL CSV rows to one file or to several shard files, each with its own header.
+
+    Shard modes:
+      - None:   everything goes to base_path
+      - rows:   start a new numbered shard every shard_size rows
+      - bytes:  start a new numbered shard before a shard would exceed shard_size bytes
+      - vault:  one shard per vault name
+      - letter: one shard per first letter of the URL host ("other" for digits, symbols or no URL)
+    """
+
+    SHARD_MODES = ["rows", "bytes", "vault", "letter"]
+
+    def __init__(self, base_path: str, fieldnames: List[str], shard_by: Optional[str] = None,
+                 shard_size: int = 0):
+        self.base_path = base_path
+        self.fieldnames = fieldnames
+        self.shard_by = shard_by
+        self.shard_size = shard_size
+        self.shards = {}
+        self.paths = []
+        self.rows_written = 0
+        self._sequence = 1
+        self._header_bytes = self.row_bytes(tuple(fieldnames))
+        self._sequence_rows = 0
+        self._sequence_bytes = self._header_bytes
+
+    @staticmethod
+    def row_bytes(row: Tuple[str, ...]) -> int:
+        """Exact encoded size of a QUOTE_ALL row written with the csv module's CRLF terminator."""
+        return sum(len(str(field).replace('"', '""').encode("utf-8")) + 3 for field in row) + 1
+
+    def shard_path(self, suffix: str) -> str:
+        base, ext = os.path.splitext(self.base_path)
+        return f"{base}_{suffix}{ext}"
+
+    def shard_for(self, row: Tuple[str, ...], vault_name: str, url: str) -> str:
+        """Pick the shard file path for a row."""
+        if self.shard_by == "vault":
+            return self.shard_path(re.sub(r'[<>:"/\\|?*\s]', '_', vault_name).strip('._') or "unnamed")
+
+        if self.shard_by == "letter":
+            host = CredentialIndex.normalize_host(url)
+            letter = host[:1]
+            return self.shard_path(letter if "a" <= letter <= "z" else "other")
+
+        if self.shard_by in ("rows", "bytes"):
+            size = self.row_bytes(row) if self.shard_by == "bytes" else 1
+            used = self._sequence_bytes if self.shard_by == "bytes" else self._sequence_rows
+            if self._sequence_rows and used + size > self.shard_size:
+                self._sequence += 1
+                self._sequence_rows = 0
+                self._sequence_bytes = self._header_bytes
+            self._sequence_rows += 1
+            self._sequence_bytes += size
+            return self.shard_path(f"{self._sequence:03d}")
+
+        return self.base_path
+
+    def open_shard(self, path: str):
+        """Open a shard file and write its header. Numbered shards are closed once the next one starts."""
+        if self.shard_by in ("rows", "bytes"):
+            self.close()
+        csvfile = open(path, 'w', newline='', encoding='utf-8')
+        writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+        writer.writerow(self.fieldnames)
+        self.shards[path] = (csvfile, writer)
+        self.paths.append(path)
+        return writer
+
+    def write_rows(self, batch: List[Tuple[Tuple[str, ...], str, str]]):
+        """Write a batch of (row, vault name, url) entries, one writerows call per shard."""
+        grouped = {}
+        for row, vault_name, url in batch:
+            path = self.shard_for(row, vault_name, url)
+            grouped.setdefault(path, []).append(row)
+
+        for path, rows in grouped.items():
+            shard = self.shards.get(path)
+            writer = shard[1] if shard else self.open_shard(path)
+            writer.writerows(rows)
+            self.rows_written += len(rows)
+
+    def close(self):
+        for csvfile, _ in self.shards.values():
+            csvfile.close()
+        self.shards = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class MemoryGovernor:
+    """Keep the exporter inside a memory budget.
+
+    Memory in use is the process RSS plus the bytes of buffers the exporter has reserved
+    but not yet released. As usage approaches the limit the governor lowers worker and
+    queue counts, shrinks copy buffers, and tells spillable structures to move to disk.
+    Without a limit every check passes and nothing is throttled or spilled. Safe to use
+    from attachment writer threads.
+    """
+
+    # Fractions of the limit where throttling starts and where spilling starts
+    THROTTLE_RATIO = 0.70
+    SPILL_RATIO = 0.85
+    # Seconds between RSS samples (reading RSS is a system call)
+    SAMPLE_INTERVAL = 0.25
+    COPY_BUFFER_SIZE = 1024 * 1024
+    MIN_COPY_BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, limit_bytes: Optional[int] = None):
+        self.limit_bytes = limit_bytes
+        self.in_flight_bytes = 0
+        self.peak_rss = 0
+        self.spilled = False
+        self._rss = 0
+        self._sampled_at = 0.0
+        self._spill_dir = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def read_rss() -> int:
+        """Current resident set size in bytes (peak RSS where the current value is unavailable)."""
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError, AttributeError):
+            pass
+        try:
+            import resource
+        except ImportError:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def usage(self) -> int:
+        """RSS (sampled at most every SAMPLE_INTERVAL seconds) plus reserved buffer bytes."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._sampled_at >= self.SAMPLE_INTERVAL:
+                self._rss = self.read_rss()
+                self._sampled_at = now
+                self.peak_rss = max(self.peak_rss, self._rss)
+            return self._rss + self.in_flight_bytes
+
+    def pressure(self) -> float:
+        """Fraction of the memory limit in use (0.0 without a limit)."""
+        if not self.limit_bytes:
+            return 0.0
+        return self.usage() / self.limit_bytes
+
+    def should_spill(self) -> bool:
+        return self.pressure() >= self.SPILL_RATIO
+
+    def throttle(self, requested: int) -> int:
+        """Scale a worker count or queue depth down as memory pressure rises."""
+        pressure = self.pressure()
+        if pressure >= self.SPILL_RATIO:
+            return 1
+        if pressure >= self.THROTTLE_RATIO:
+            return max(1, requested // 2)
+        return requested
+
+    def copy_buffer_size(self) -> int:
+        return self.MIN_COPY_BUFFER_SIZE if self.should_spill() else self.COPY_BUFFER_SIZE
+
+    def reserve(self, size: int):
+        with self._lock:
+            self.in_flight_bytes += size
+
+    def release(self, size: int):
+        with self._lock:
+            self.in_flight_bytes -= size
+
+    def spill_path(self, name: str) -> str:
+        """Path for a spill file in a private temporary directory, created on first use."""
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="1password_exporter_spill_")
+        self.spilled = True
+        return os.path.join(self._spill_dir, name)
+
+    def close(self):
+        """Delete spill files."""
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+
+class SpillDict:
+    """String-keyed map that moves into a temporary SQLite table under memory pressure.
+
+    Values are ints, strings or lists/tuples of them. Once spilled they are stored as JSON,
+    so tuples read back as lists; iteration keeps insertion order either way.
+    """
+
+    # Operations between memory pressure checks
+    CHECK_EVERY = 1000
+
+    def __init__(self, governor: MemoryGovernor, name: str):
+        self.governor = governor
+        self.name = name
+        self._memory = {}
+        self._db = None
+        self._operations = 0
+
+    def _spill(self):
+        self._db = sqlite3.connect(self.governor.spill_path(f"{self.name}.sqlite3"))
+        self._db.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.executemany("INSERT INTO entries VALUES (?, ?)",
+                             ((key, json.dumps(value)) for key, value in self._memory.items()))
+        self._memory = {}
+
+    def _count_operation(self):
+        self._operations += 1
+        if self._operations % self.CHECK_EVERY == 0 and self.governor.should_spill():
+            self._spill()
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        if self._db is None:
+            return len(self._memory)
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if self._db is None:
+            return self._memory.get(key, default)
+        row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        if self._db is None:
+            self._memory[key] = value
+            self._count_operation()
+            return
+        # UPDATE first: INSERT OR REPLACE would move the key to the end of the iteration order
+        value = json.dumps(value)
+        if not self._db.execute("UPDATE entries SET value = ? WHERE key = ?", (value, key)).rowcount:
+            self._db.execute("INSERT INTO entries VALUES (?, ?)", (key, value))
+
+    def append(self, key: str, value: Any):
+        """Append to the list stored under key, starting the list if there is none."""
+        if self._db is None:
+            self._memory.setdefault(key, []).append(value)
+            self._count_operation()
+            return
+        values = self.get(key, [])
+        values.append(value)
+        self[key] = values
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        if self._db is None:
+            yield from self._memory.items()
+            return
+        for key, value in self._db.execute("SELECT key, value FROM entries ORDER BY rowid"):
+            yield key, json.loads(value)
+
+    def values(self) -> Iterator[Any]:
+        for _, value in self.items():
+            yield value
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class AttachmentWriter:
+    """Size-tiered scheduler for writing extracted attachments.
+
+    Attachments smaller than large_size are written by the small tier as they are found,
+    alongside the item pass. Larger ones are queued and written by the large tier once the
+    pass is done, largest first, so big sequential writes are not interleaved with thousands
+    of small files. Each large file is preallocated to its ZipInfo.file_size with
+    os.posix_fallocate where available, and all-zero blocks are skipped instead of written
+    (they read back as zeros from the preallocated or sparse file). Each tier has its own
+    worker count, reduced by the memory governor under pressure. on_done(context, error,
+    large) is called from the caller's thread for every attachment, in submission order
+    within each tier.
+    """
+
+    DEFAULT_LARGE_SIZE = 8 * 1024 ** 2
+    DEFAULT_SMALL_WORKERS = 2
+    DEFAULT_LARGE_WORKERS = 1
+
+    def __init__(self, zip_ref: zipfile.ZipFile, governor: "MemoryGovernor",
+                 on_done: Callable[[Any, Optional[Exception], bool], None],
+                 small_workers: Optional[int] = None, large_workers: Optional[int] = None,
+                 large_size: Optional[int] = None):
+        self.zip_ref = zip_ref
+        self.governor = governor
+        self.on_done = on_done
+        self.large_size = large_size or self.DEFAULT_LARGE_SIZE
+        self.large_workers = large_workers or self.DEFAULT_LARGE_WORKERS
+        self._small_pool = ThreadPoolExecutor(
+            max_workers=governor.throttle(small_workers or self.DEFAULT_SMALL_WORKERS))
+        self._small_pending = deque()
+        self._large_queue = []
+        # Output paths submitted but not written yet, so callers can avoid reusing a name
+        self.pending_paths = set()
+
+    def submit(self, zip_info: zipfile.ZipInfo, output_path: str, context: Any):
+        """Queue one archive member to be written to output_path."""
+        self.pending_paths.add(output_path)
+        if zip_info.file_size >= self.large_size:
+            self._large_queue.append((zip_info, output_path, context))
+            return
+        future = self._small_pool.submit(self.write, zip_info, output_path, False)
+        self._small_pending.append((future, output_path, context))
+        self.collect()
+
+    def collect(self, wait: bool = False):
+        """Report finished small-tier writes, oldest first (all of them when wait is True)."""
+        while self._small_pending and (wait or self._small_pending[0][0].done()):
+            future, output_path, context = self._small_pending.popleft()
+            self.finish(future, output_path, context, False)
+
+    def finish(self, future, output_path: str, context: Any, large: bool):
+        self.pending_paths.discard(output_path)
+        try:
+            future.result()
+        except Exception as e:
+            self.on_done(context, e, large)
+        else:
+            self.on_done(context, None, large)
+
+    def write(self, zip_info: zipfile.ZipInfo, output_path: str, large: bool):
+        buffer_size = self.governor.copy_buffer_size()
+        self.governor.reserve(buffer_size)
+        try:
+            with self.zip_ref.open(zip_info) as source, open(output_path, 'wb') as target:
+                if not large:
+                    shutil.copyfileobj(source, target, buffer_size)
+                    return
+
+                if zip_info.file_size and hasattr(os, "posix_fallocate"):
+                    try:
+                        os.posix_fallocate(target.fileno(), 0, zip_info.file_size)
+                    except OSError:
+                        pass  # Not supported by this filesystem; write without preallocation
+
+                zero_block = bytes(buffer_size)
+                while True:
+                    block = source.read(buffer_size)
+                    if not block:
+                        break
+                    if block == zero_block or (len(block) < buffer_size and not block.strip(b"\0")):
+                        target.seek(len(block), os.SEEK_CUR)
+                    else:
+                        target.write(block)
+                # Sets the final size, including any skipped zero blocks at the end
+                target.truncate()
+        except Exception:
+            try:
+                os.remove(output_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            self.governor.release(buffer_size)
+
+    def close(self):
+        """Finish the small tier, then write the large tier in descending size order."""
+        self.collect(wait=True)
+        self._small_pool.shutdown()
+
+        jobs = sorted(self._large_queue, key=lambda job: job[0].file_size, reverse=True)
+        self._large_queue = []
+        if not jobs:
+            return
+        with ThreadPoolExecutor(max_workers=self.governor.throttle(self.large_workers)) as pool:
+            futures = [(pool.submit(self.write, zip_info, output_path, True), output_path, context)
+                       for zip_info, output_path, context in jobs]
+            for future, output_path, context in futures:
+                self.finish(future, output_path, context, True)
+
+    def abort(self):
+        """Stop without writing queued large attachments (used when the export fails)."""
+        self._small_pool.shutdown()
+        self._small_pending.clear()
+        self._large_queue = []
+        self.pending_paths.clear()
+
+
+class EventJournal:
+    """Append-only NDJSON log of export events and errors.
+
+    Each event is written as one JSON line as it happens: time, seconds since the export
+    started, stage, item uuid and vault, and for errors the error class and message.
+    In memory only per-class error counts and the first SAMPLE_SIZE messages are kept,
+    so memory use does not grow with the number of errors. Events before open() (the
+    validate stage) are held, up to EARLY_EVENTS, and written when the file is opened;
+    ExportReader never opens it, so there events are only counted. The file is line
+    buffered so a crash or OOM kill loses at most the event being written.
+    """
+
+    FILE_NAME = "export_journal.ndjson"
+    SAMPLE_SIZE = 10
+    EARLY_EVENTS = 100
+
+    def __init__(self):
+        self.path = None
+        self.started = time.perf_counter()
+        self.error_counts: Dict[str, int] = {}
+        self.samples: List[str] = []
+        self._file = None
+        self._early = []
+
+    def open(self, path: str):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8', buffering=1)
+        for line in self._early:
+            self._file.write(line)
+        self._early = []
+
+    def event(self, event: str, stage: str, item_uuid: Optional[str] = None, vault: Optional[str] = None,
+              error_class: Optional[str] = None, message: Optional[str] = None):
+        if self._file is None and len(self._early) >= self.EARLY_EVENTS:
+            return
+        entry = {"time": datetime.now().isoformat(timespec="milliseconds"),
+                 "elapsed": round(time.perf_counter() - self.started, 4),
+                 "event": event, "stage": stage}
+        if item_uuid is not None:
+            entry["item"] = item_uuid
+        if vault is not None:
+            entry["vault"] = vault
+        if error_class is not None:
+            entry["error_class"] = error_class
+        if message is not None:
+            entry["message"] = message
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        if self._file is None:
+            self._early.append(line)
+        else:
+            self._file.write(line)
+
+    def error(self, stage: str, error_class: str, message: str, item_uuid: Optional[str] = None,
+              vault: Optional[str] = None):
+        self.error_counts[error_class] = self.error_counts.get(error_class, 0) + 1
+        if len(self.samples) < self.SAMPLE_SIZE:
+            self.samples.append(message)
+        self.event("error", stage, item_uuid, vault, error_class, message)
+
+    def __len__(self) -> int:
+        return sum(self.error_counts.values())
+
+    def __bool__(self) -> bool:
+        return bool(self.error_counts)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ItemIndex:
+    """uuid -> (title, category, location) of every item, for resolving reference fields.
+
+    Entries are added as items stream past, so a reference to an item later in the export
+    cannot be resolved when it is first formatted. It is written as the raw
+    "[Reference: <uuid>]" placeholder and replaced once the pass has indexed everything
+    (see PasswordExporter.resolve_pending_references). Entries are held in a SpillDict,
+    so they move to disk under the governor's memory limit.
+    """
+
+    PLACEHOLDER = re.compile(r"\[Reference: ([A-Za-z0-9_-]+)\]")
+
+    def __init__(self, governor: MemoryGovernor):
+        self.entries = SpillDict(governor, "item_index")
+
+    def add(self, item_uuid: str, title: str, category_name: str, location: str):
+        if item_uuid:
+            self.entries[item_uuid] = (title, category_name, location)
+
+    def set_location(self, item_uuid: str, location: str):
+        """Replace an item's location once its output path is known."""
+        entry = self.entries.get(item_uuid)
+        if entry:
+            self.entries[item_uuid] = (entry[0], entry[1], location)
+
+    def describe(self, item_uuid: str) -> Optional[str]:
+        """Human-readable reference to an indexed item, or None if it is not indexed (yet)."""
+        entry = self.entries.get(item_uuid)
+        if entry is None:
+            return None
+        title, category_name, location = entry
+        return f"[Reference: {title} ({category_name}) - {location}]"
+
+    def close(self):
+        self.entries.close()
+
+
+@lru_cache(maxsize=None)
+def normalize_label(key: str) -> str:
+    """Display label for a nested field key ("street_address" -> "Street"). Memoized per key."""
+    return key.replace("_", " ").replace("Address", "").replace("address", "").title().strip()
+
+
+@lru_cache(maxsize=None)
+def template_key(label: str) -> str:
+    """Name under which a field is available to templates as field.<name> ("Cardholder Name" -> "cardholder_name")."""
+    return re.sub(r"\W+", "_", label.lower()).strip("_")
+
+
+class ItemTemplate:
+    """Layout of a non-password item document, compiled once into a Python render function.
+
+    Templates use a Mustache subset:
+      {{name}}               the value (HTML-escaped for .html/.htm templates)
+      {{#name}}...{{/name}}  the block once per element of a list, or once if the value is set
+      {{^name}}...{{/name}}  the block if the value is empty
+    Lines holding only a block tag are dropped. Names are resolved when the template is
+    compiled, from the innermost block outwards, straight to attributes of the record and
+    its formatted fields, so rendering builds no intermediate dictionaries:
+      item:        title, category, vault, uuid, url, notes, sections, has_sections,
+                   attachments, attachment_count, has_attachments, field.<label>
+                   (a field value by lower-case label, e.g. field.cardholder_name)
+      sections:    title, fields
+      fields:      label, value, concealed
+      attachments: filename
+    """
+
+    TAG = re.compile(r"\{\{\s*([#^/]?)\s*([\w.]+)\s*\}\}")
+    STANDALONE_TAG = re.compile(r"^[ \t]*(\{\{\s*[#^/]\s*[\w.]+\s*\}\})[ \t]*(?:\r?\n|$)", re.M)
+    HTML_EXTENSIONS = (".html", ".htm")
+
+    # Names per scope: name -> (expression, scope entered by a block over it, value is text).
+    # "{0}" in an expression is the loop variable of the block that opened the scope.
+    SCOPES = {
+        "item": {
+            "title": ("record.title", None, True),
+            "category": ("record.category_name", None, True),
+            "vault": ("record.vault_name", None, True),
+            "uuid": ("(record.item.get('uuid') or '')", None, True),
+            "url": ("record.url", None, True),
+            "notes": ("record.notes", None, True),
+            "sections": ("sections", "section", False),
+            "has_sections": ("bool(sections)", None, False),
+            "attachments": ("attachment_files", "attachment", False),
+            "attachment_count": ("len(attachment_files)", None, False),
+            "has_attachments": ("bool(attachment_files)", None, False),
+        },
+        "section": {"title": ("{0}[0]", None, True), "fields": ("{0}[1]", "field", False)},
+        "field": {"label": ("{0}[0]", None, True), "value": ("{0}[1]", None, True),
+                  "concealed": ("{0}[2]", None, False)},
+        "attachment": {"filename": ("{0}", None, True)},
+    }
+
+    DEFAULT_SOURCE = (
+        "{{title}}\n"
+        "\n"
+        "BASIC INFORMATION\n"
+        "Category: {{category}}\n"
+        "{{#url}}\nURL: {{url}}\n{{/url}}\n"
+        "{{#notes}}\n\nNOTES\n{{notes}}\n{{/notes}}\n"
+        "{{#has_sections}}\n"
+        "\n"
+        "DETAILS\n"
+        "{{#sections}}\n"
+        "{{#title}}\n\n{{title}}:\n{{/title}}\n"
+        "{{#fields}}\n{{label}}: {{value}}\n{{/fields}}\n"
+        "{{/sections}}\n"
+        "{{/has_sections}}\n"
+        "{{#has_attachments}}\n"
+        "\n"
+        "ATTACHMENTS\n"
+        "This item has {{attachment_count}} attachment(s) in this folder:\n"
+        "\n"
+        "{{#attachments}}\n  • {{filename}}\n{{/attachments}}\n"
+        "{{/has_attachments}}\n"
+    )
+
+    def __init__(self, source: str, extension: str = ".txt", name: str = "default"):
+        self.source = source
+        self.extension = extension
+        self.name = name
+        self.html = extension.lower() in self.HTML_EXTENSIONS
+        # render(record, record sections, attachment file names) -> document text
+        self.render: Callable[..., str] = self.compile()
+
+    def resolve(self, name: str, scopes: List[Tuple[str, str]]) -> Tuple[str, Optional[str], bool]:
+        """Expression for a name in the innermost scope defining it. Raises ValueError if none does."""
+        first, _, key = name.partition(".")
+        if first == "field" and key:
+            return f"field_values.get({template_key(key)!r}, '')", None, True
+        for scope, variable in reversed(scopes):
+            if name in self.SCOPES[scope]:
+                expression, child, is_text = self.SCOPES[scope][name]
+                return expression.format(variable), child, is_text
+        raise ValueError(f"Template {self.name}: unknown name {{{{{name}}}}}")
+
+    def compile(self) -> Callable[..., str]:
+        """Translate the template into the source of a Python function and compile it.
+
+        Raises ValueError for unknown names and unbalanced block tags.
+        """
+        source = self.STANDALONE_TAG.sub(r"\1", self.source)
+        body = []
+        scopes = [("item", "")]
+        open_blocks = []
+        position = 0
+
+        def emit(statement: str):
+            body.append(" " * (len(open_blocks) + 1) + statement)
+
+        def emit_text(text: str):
+            if text:
+                emit(f"append({text!r})")
+
+        for match in self.TAG.finditer(source):
+            emit_text(source[position:match.start()])
+            position = match.end()
+            kind, name = match.groups()
+
+            if kind == "/":
+                if not open_blocks or open_blocks[-1][0] != name:
+                    raise ValueError(f"Template {self.name}: unexpected {{{{/{name}}}}}")
+                emit("pass")
+                if open_blocks.pop()[1]:
+                    scopes.pop()
+                continue
+
+            expression, child, is_text = self.resolve(name, scopes)
+            if kind == "#" and child:
+                variable = f"v{len(scopes)}"
+                emit(f"for {variable} in {expression}:")
+                open_blocks.append((name, True))
+                scopes.append((child, variable))
+            elif kind:
+                emit(f"if {'' if kind == '#' else 'not '}{expression}:")
+                open_blocks.append((name, False))
+            else:
+                value = expression if is_text else f"str({expression})"
+                emit(f"append({f'_escape({value})' if self.html else value})")
+
+        if open_blocks:
+            raise ValueError(f"Template {self.name}: {{{{#{open_blocks[-1][0]}}}}} is never closed")
+        emit_text(source[position:])
+
+        lines = ["def render(record, sections, attachment_files):", " out = []", " append = out.append"]
+        if "field_values" in "".join(body):
+            lines.append(" field_values = _field_values(sections)")
+        lines += body + [" return ''.join(out)"]
+
+        namespace = {"_escape": html_escape, "_field_values": self._field_values}
+        exec(compile("\n".join(lines), f"<template {self.name}>", "exec"), namespace)
+        return namespace["render"]
+
+    @staticmethod
+    def _field_values(sections: List[Tuple[str, List[Tuple[str, str, bool]]]]) -> Dict[str, str]:
+        """First value of every field by template key, for field.<label> lookups."""
+        values = {}
+        for _, fields in sections:
+            for label, value, _ in fields:
+                values.setdefault(template_key(label), value)
+        return values
+
+
+class ExportRecord:
+    """One exported item with the values shared by every output sink.
+
+    PasswordExporter.build_record runs the extract_* methods once per item; sinks read
+    the results from here. Section fields are formatted on first use and cached
+    (see PasswordExporter.record_sections).
+    """
+
+    __slots__ = ("vault_name", "item", "category_uuid", "category_name", "title",
+                 "url", "username", "password", "notes", "otp", "sections", "pending_references", "vault_id")
+
+    def __init__(self, vault_name: str, item: Dict[str, Any], category_uuid: str, category_name: str,
+                 title: str, url: str, username: str, password: str, notes: str, otp: str,
+                 vault_id: Optional[str] = None):
+        self.vault_name = vault_name
+        # Identifies the vault across accounts, where vault names can repeat (see PasswordExporter.vault_id)
+        self.vault_id = vault_id or vault_name
+        self.item = item
+        self.category_uuid = category_uuid
+        self.category_name = category_name
+        self.title = title
+        self.url = url
+        self.username = username
+        self.password = password
+        self.notes = notes
+        self.otp = otp
+        self.sections = None
+        # True when a reference field pointed at an item not indexed yet (fixed up after the pass)
+        self.pending_references = False
+
+
+class ItemDocument:
+    """A non-password item's text document, written once all its attachments have been.
+
+    Attachments are written in the background (see AttachmentWriter), so the document is
+    held until every queued attachment has succeeded or failed and then lists only the
+    files actually in the folder.
+    """
+
+    __slots__ = ("record", "path", "attachment_files", "failed_files", "outstanding", "sealed")
+
+    def __init__(self, record: "ExportRecord", path: str):
+        self.record = record
+        self.path = path
+        self.attachment_files: List[str] = []
+        self.failed_files: set = set()
+        self.outstanding = 0
+        # Set once every attachment of the item has been queued
+        self.sealed = False
+
+
+# What PasswordExporter.record_attachment is handed back for each queued attachment:
+# (relative path, archive member, file name, safe file name, item uuid, vault name, document)
+AttachmentContext = Tuple[str, str, str, str, Optional[str], Optional[str], Optional[ItemDocument]]
+
+
+class ExportSink:
+    """An output format fed one ExportRecord at a time from a single pass over the export."""
+
+    def accepts(self, record: ExportRecord) -> bool:
+        """Whether this sink wants the record (skipped items never reach any sink)."""
+        return True
+
+    def write(self, record: ExportRecord):
+        raise NotImplementedError
+
+    def close(self):
+        """Finish the output once every record has been written."""
+
+    def pending_reference_files(self) -> List[Tuple[str, Callable[[str], str]]]:
+        """Files written with unresolved reference placeholders, each with its format's escape function."""
+        return []
+
+
+class PasswordCsvSink(ExportSink):
+    """Apple Passwords CSV (optionally sharded) with duplicate detection for Login items."""
+
+    FIELDNAMES = ['Title', 'URL', 'Username', 'Password', 'Notes', 'OTPAuth']
+
+    def __init__(self, exporter: "PasswordExporter"):
+        self.exporter = exporter
+        self.writer = ShardedCsvWriter(exporter.passwords_csv_path, self.FIELDNAMES,
+                                       exporter.shard_by, exporter.shard_size)
+        # Track duplicate titles (shared by every shard so suffixes stay globally unique)
+        self.title_counts = SpillDict(exporter.governor, "title_counts")
+        self.credential_index = CredentialIndex(exporter.governor)
+        # Keyed digest of (URL, notes, OTP) of the first row written per credential, so rows
+        # are only collapsed when dropping them loses nothing
+        self.row_details = SpillDict(exporter.governor, "row_details")
+        self.duplicates_kept = 0
+        self.batch = []
+
+    def accepts(self, record: ExportRecord) -> bool:
+        return self.exporter.is_password_item(record.item)
+
+    def write(self, record: ExportRecord):
+        base_title = record.title
+
+        # Same host, username and password as an earlier row
+        credential_key = self.credential_index.make_key(record.url, record.username, record.password)
+        if self.exporter.collapse_duplicates:
+            details = self.credential_index.password_digest("\0".join((record.url, record.notes, record.otp)))
+            original_title = self.credential_index.find_exact(credential_key)
+            details_key = CredentialIndex.storage_key(credential_key)
+            if original_title is not None and self.row_details.get(details_key) == details:
+                self.credential_index.add(f"{base_title} (collapsed into {original_title})", credential_key)
+                self.exporter.item_index.set_location(record.item.get("uuid"), f'passwords CSV as "{original_title}"')
+                self.exporter.stats["duplicates_collapsed"] += 1
+                return
+            if original_title is None:
+                self.row_details[details_key] = details
+            else:
+                # Written anyway: its URL, notes or OTP secret differ from the row it duplicates
+                self.duplicates_kept += 1
+
+        # Handle duplicate titles
+        if base_title in self.title_counts:
+            self.title_counts[base_title] += 1
+            title = f"{base_title}_{self.title_counts[base_title]}"
+        else:
+            self.title_counts[base_title] = 1
+            title = base_title
+
+        self.credential_index.add(title, credential_key)
+        self.exporter.item_index.set_location(record.item.get("uuid"), f'passwords CSV as "{title}"')
+        row = (title, record.url, record.username, record.password, record.notes, record.otp)
+        self.batch.append((row, record.vault_name, record.url))
+
+        # Rows are written with one writerows call per shard per batch
+        if len(self.batch) >= self.exporter.RENDER_CHUNK_SIZE:
+            self.writer.write_rows(self.batch)
+            self.batch = []
+
+    def close(self):
+        exporter = self.exporter
+        self.writer.write_rows(self.batch)
+        self.batch = []
+
+        # An export without logins still gets a header-only CSV
+        if not self.writer.paths:
+            self.writer.open_shard(exporter.passwords_csv_path)
+        self.writer.close()
+        self.title_counts.close()
+
+        # Count actual rows written (excluding header)
+        exporter.stats["password_items"] = self.writer.rows_written
+        exporter.stats["csv_files"] = self.writer.paths
+        if exporter.shard_by:
+            print(f"Exported {exporter.stats['password_items']} password items to {len(self.writer.paths)} "
+                  f"CSV shards (by {exporter.shard_by}) in: {exporter.output_dir}")
+        else:
+            print(f"Exported {exporter.stats['password_items']} password items to: {exporter.passwords_csv_path}")
+        if exporter.stats["duplicates_collapsed"]:
+            print(f"Collapsed {exporter.stats['duplicates_collapsed']} exact duplicate logins")
+        if self.duplicates_kept:
+            print(f"Kept {self.duplicates_kept} exact duplicate logins whose URL, notes or OTP differ")
+        self.row_details.close()
+
+        exporter.record_duplicate_groups(self.credential_index)
+        self.credential_index.close()
+
+
+class TextTreeSink(ExportSink):
+    """Human-readable text file and attachments per non-password item in non_password_data/."""
+
+    def __init__(self, exporter: "PasswordExporter", zip_ref: zipfile.ZipFile):
+        self.exporter = exporter
+        self.zip_ref = zip_ref
+
+    def accepts(self, record: ExportRecord) -> bool:
+        return not self.exporter.is_password_item(record.item)
+
+    def write(self, record: ExportRecord):
+        # Export non-password data (includes attachment extraction)
+        text_path = self.exporter.export_non_password_item(record, self.zip_ref)
+
+        # References to this item point at its folder from now on
+        folder = os.path.relpath(os.path.dirname(text_path), self.exporter.output_dir)
+        self.exporter.item_index.set_location(record.item.get("uuid"), folder.replace(os.sep, "/"))
+
+    def pending_reference_files(self) -> List[Tuple[str, Callable[[str], str]]]:
+        # Documents are written once their attachments are, so the exporter collects the paths
+        return [(path, html_escape if path.lower().endswith(ItemTemplate.HTML_EXTENSIONS) else str)
+                for path in self.exporter.pending_reference_documents]
+
+
+class BitwardenJsonSink(ExportSink):
+    """Bitwarden unencrypted JSON export, streamed one item at a time.
+
+    Logins become login items; every other category becomes a secure note. Section fields
+    become custom fields (hidden for concealed values) and each vault becomes a folder,
+    keyed by ExportRecord.vault_id so same-named vaults in different accounts stay apart.
+    """
+
+    def __init__(self, exporter: "PasswordExporter", path: str):
+        self.exporter = exporter
+        self.path = path
+        self.folders = {}
+        self.count = 0
+        self.has_pending_references = False
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('{\n  "encrypted": false,\n  "items": [')
+
+    def folder_id(self, record: ExportRecord) -> str:
+        if record.vault_id not in self.folders:
+            folder_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"1password-vault:{record.vault_id}"))
+            self.folders[record.vault_id] = (folder_id, record.vault_name)
+        return self.folders[record.vault_id][0]
+
+    def write(self, record: ExportRecord):
+        fields = []
+        for _, field_title, value, concealed in self.exporter.record_fields(record):
+            fields.append({"name": field_title, "value": value, "type": 1 if concealed else 0})
+
+        entry = {
+            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"1password-item:{record.item.get('uuid', self.count)}")),
+            "organizationId": None,
+            "folderId": self.folder_id(record),
+            "type": 2,
+            "name": record.title,
+            "notes": record.notes or None,
+            "favorite": bool(record.item.get("favIndex")),
+            "fields": fields,
+        }
+        if self.exporter.is_password_item(record.item):
+            entry["type"] = 1
+            entry["login"] = {
+                "uris": [{"match": None, "uri": record.url}] if record.url else [],
+                "username": record.username or None,
+                "password": record.password or None,
+                "totp": record.otp or None,
+            }
+        else:
+            entry["secureNote"] = {"type": 0}
+            if record.url:
+                fields.insert(0, {"name": "URL", "value": record.url, "type": 0})
+
+        self.file.write(("\n    " if self.count == 0 else ",\n    ") + json.dumps(entry, ensure_ascii=False))
+        self.count += 1
+        self.has_pending_references = self.has_pending_references or record.pending_references
+
+    def close(self):
+        folders = [{"id": folder_id, "name": name} for folder_id, name in self.folders.values()]
+        self.file.write(f"\n  ],\n  \"folders\": {json.dumps(folders, ensure_ascii=False)}\n}}\n")
+        self.file.close()
+        print(f"Exported {self.count} items to Bitwarden JSON: {self.path}")
+
+    def pending_reference_files(self) -> List[Tuple[str, Callable[[str], str]]]:
+        if not self.has_pending_references:
+            return []
+        # Escape as the inside of a JSON string
+        return [(self.path, lambda text: json.dumps(text, ensure_ascii=False)[1:-1])]
+
+
+class KeePassXmlSink(ExportSink):
+    """KeePass 2.x XML (importable by KeePass and KeePassXC), streamed one entry at a time.
+
+    Every vault becomes a group under the root group. Items arrive vault by vault, so a
+    group is closed as soon as the next vault starts.
+    """
+
+    def __init__(self, exporter: "PasswordExporter", path: str):
+        self.exporter = exporter
+        self.path = path
+        self.count = 0
+        self.current_vault = None
+        self.has_pending_references = False
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('<?xml version="1.0" encoding="utf-8" standalone="yes"?>\n'
+                        '<KeePassFile>\n\t<Meta>\n\t\t<Generator>1Password Exporter</Generator>\n\t</Meta>\n'
+                        '\t<Root>\n\t\t<Group>\n\t\t\t<Name>1Password</Name>\n')
+
+    @staticmethod
+    def keepass_uuid(name: str) -> str:
+        return base64.b64encode(uuid.uuid5(uuid.NAMESPACE_URL, name).bytes).decode("ascii")
+
+    @staticmethod
+    def string_element(key: str, value: str, protected: bool = False) -> str:
+        protect = ' ProtectInMemory="True"' if protected else ''
+        return (f"\t\t\t\t\t<String><Key>{xml_escape(key)}</Key>"
+                f"<Value{protect}>{xml_escape(value)}</Value></String>\n")
+
+    def write(self, record: ExportRecord):
+        if record.vault_id != self.current_vault:
+            if self.current_vault is not None:
+                self.file.write("\t\t\t</Group>\n")
+            self.current_vault = record.vault_id
+            self.file.write(f"\t\t\t<Group>\n\t\t\t\t<UUID>{self.keepass_uuid('vault:' + record.vault_id)}</UUID>"
+                            f"\n\t\t\t\t<Name>{xml_escape(record.vault_name)}</Name>\n")
+
+        parts = ["\t\t\t\t<Entry>\n",
+                 f"\t\t\t\t\t<UUID>{self.keepass_uuid('item:' + str(record.item.get('uuid', self.count)))}</UUID>\n",
+                 self.string_element("Title", record.title),
+                 self.string_element("UserName", record.username),
+                 self.string_element("Password", record.password, protected=True),
+                 self.string_element("URL", record.url),
+                 self.string_element("Notes", record.notes)]
+        if record.otp:
+            parts.append(self.string_element("otp", record.otp, protected=True))
+
+        # KeePass string keys must be unique within an entry
+        used_keys = {"Title", "UserName", "Password", "URL", "Notes", "otp"}
+        for section_title, field_title, value, concealed in self.exporter.record_fields(record):
+            key = field_title
+            if key in used_keys and section_title:
+                key = f"{section_title} - {field_title}"
+            counter = 2
+            while key in used_keys:
+                key = f"{field_title} ({counter})"
+                counter += 1
+            used_keys.add(key)
+            parts.append(self.string_element(key, value, protected=concealed))
+
+        parts.append("\t\t\t\t</Entry>\n")
+        self.file.write("".join(parts))
+        self.count += 1
+        self.has_pending_references = self.has_pending_references or record.pending_references
+
+    def close(self):
+        if self.current_vault is not None:
+            self.file.write("\t\t\t</Group>\n")
+        self.file.write("\t\t</Group>\n\t</Root>\n</KeePassFile>\n")
+        self.file.close()
+        print(f"Exported {self.count} items to KeePass XML: {self.path}")
+
+    def pending_reference_files(self) -> List[Tuple[str, Callable[[str], str]]]:
+        return [(self.path, xml_escape)] if self.has_pending_references else []
 
 
 class PasswordExporter:
@@ -45,21 +1179,77 @@ class PasswordExporter:
         "114": "SSH Key"
     }
 
-    def __init__(self, input_file: str, output_dir: str = None):
-        """Initialize the exporter with input file path."""
+    # Login items rendered per worker task when building CSV rows
+    RENDER_CHUNK_SIZE = 500
+
+    # Default shard size per shard mode when --shard-size is not given
+    DEFAULT_SHARD_SIZES = {"rows": 1000, "bytes": 10 * 1024 ** 2}
+
+    # Output formats, each written by one ExportSink from the same pass over the items
+    OUTPUT_FORMATS = ["apple-csv", "text", "bitwarden", "keepass"]
+    DEFAULT_FORMATS = ["apple-csv", "text"]
+
+    # Planning estimates for work that --plan cannot time without writing to disk
+    PLAN_SECONDS_PER_INODE = 0.0005
+    PLAN_WRITE_BYTES_PER_SECOND = 100 * 1024 ** 2
+    # Headroom added to the planned size before checking free space
+    PLAN_SPACE_MARGIN = 1.10
+
+    def __init__(self, input_file: str, output_dir: str = None,
+                 collapse_duplicates: bool = False, duplicate_report: bool = False,
+                 shard_by: Optional[str] = None, shard_size: Optional[int] = None,
+                 render_workers: int = 1, plan_only: bool = False,
+                 memory_limit: Optional[int] = None, formats: Optional[List[str]] = None,
+                 verify: bool = False, sha256: bool = False, template_dir: Optional[str] = None,
+                 attachment_workers: Optional[int] = None, large_attachment_workers: Optional[int] = None,
+                 large_attachment_size: Optional[int] = None):
+        """Initialize the exporter with input file path and export options.
+
+        Raises ValueError if a template in template_dir cannot be read or compiled.
+        """
         self.input_file = input_file
+        self.verify = verify
+        self.sha256 = sha256
+        self.formats = formats or list(self.DEFAULT_FORMATS)
+        self.plan_only = plan_only
+        self.governor = MemoryGovernor(memory_limit)
+        self.item_index = ItemIndex(self.governor)
+        self.journal = EventJournal()
+        self.templates = self.load_templates(template_dir)
+        self._pending_reference_seen = False
+        self._pending_references = {}
+        # Item documents written with a reference placeholder (see write_item_document)
+        self.pending_reference_documents: List[str] = []
+        # Callables invoked with a stage name at each stage boundary (used by --profile/--trace-memory)
+        self.stage_hooks: List[Callable[[str], None]] = []
+        self.collapse_duplicates = collapse_duplicates
+        self.duplicate_report = duplicate_report
+        self.shard_by = shard_by
+        self.shard_size = shard_size or self.DEFAULT_SHARD_SIZES.get(shard_by, 0)
+        self.render_workers = max(1, render_workers)
+        # Attachment writer tiers (AttachmentWriter defaults when None)
+        self.attachment_workers = attachment_workers
+        self.large_attachment_workers = large_attachment_workers
+        self.large_attachment_size = large_attachment_size
+        self.attachment_index = ([], [])
+        self.attachment_writer = None
         script_dir = os.path.dirname(os.path.abspath(__file__))
         self.output_dir = output_dir if output_dir else os.path.join(script_dir, "outputs")
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-        # Clean output directory if it exists
-        if os.path.exists(self.output_dir):
-            import shutil
-            shutil.rmtree(self.output_dir)
-
-        # Create output directories
+        # Output paths (directories are created by create_output_directories)
         self.passwords_csv_path = os.path.join(self.output_dir, "exported_passwords.csv")
+        self.duplicate_report_path = os.path.join(self.output_dir, "duplicate_report.csv")
         self.non_password_dir = os.path.join(self.output_dir, "non_password_data")
+        self.bitwarden_json_path = os.path.join(self.output_dir, "bitwarden_export.json")
+        self.keepass_xml_path = os.path.join(self.output_dir, "keepass_export.xml")
+        self.attachment_manifest_path = os.path.join(self.output_dir, AttachmentVerifier.MANIFEST_NAME)
+        self.journal_path = os.path.join(self.output_dir, EventJournal.FILE_NAME)
+
+        # (path relative to output_dir, archive member) of every extracted attachment
+        self.extracted_attachments = []
+        # Referenced attachments that are missing from the archive or could not be written
+        self.failed_attachments = []
 
         # Statistics
         self.stats = {
@@ -68,9 +1258,20 @@ class PasswordExporter:
             "non_password_items": 0,
             "skipped_items": 0,
             "attachments_extracted": 0,
-            "errors": []
+            "duplicates_collapsed": 0,
+            "duplicate_groups": {},
+            "csv_files": [],
+            "references_resolved": 0,
+            "references_deferred": 0,
+            "references_unresolved": 0
         }
 
+    def mark_stage(self, name: str):
+        """Journal the end of the named stage and notify stage hooks."""
+        self.journal.event("stage_finished", name)
+        for hook in self.stage_hooks:
+            hook(name)
+
     def validate_input_file(self) -> bool:
         """Validate that the input file exists and is a valid .1pux file."""
         if not os.path.exists(self.input_file):
@@ -87,8 +1288,13 @@ class PasswordExporter:
         return True
 
     def create_output_directories(self):
-        """Create necessary output directories."""
-        os.makedirs(self.non_password_dir, exist_ok=True)
+        """Clean any previous output and create the necessary output directories."""
+        if os.path.exists(self.output_dir):
+            shutil.rmtree(self.output_dir)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        if "text" in self.formats:
+            os.makedirs(self.non_password_dir, exist_ok=True)
 
     def extract_username(self, item: Dict[str, Any]) -> str:
         """Extract username from login fields."""
@@ -159,45 +1365,140 @@ class PasswordExporter:
 
         return category_uuid in password_categories
 
-    def export_passwords_to_csv(self, items: List[Dict[str, Any]]):
-        """Export password items to Apple Passwords CSV format."""
-        password_items = [item for item in items if self.is_password_item(item)]
-
-        # Track duplicate titles
-        title_counts = {}
-
-        with open(self.passwords_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Title', 'URL', 'Username', 'Password', 'Notes', 'OTPAuth']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
-
-            writer.writeheader()
-
-            for item in password_items:
-                overview = item.get("overview", {})
-                base_title = overview.get("title", "Untitled")
-
-                # Handle duplicate titles
-                if base_title in title_counts:
-                    title_counts[base_title] += 1
-                    title = f"{base_title}_{title_counts[base_title]}"
-                else:
-                    title_counts[base_title] = 1
-                    title = base_title
-
-                row = {
-                    'Title': title,
-                    'URL': self.extract_url(item),
-                    'Username': self.extract_username(item),
-                    'Password': self.extract_password(item),
-                    'Notes': self.extract_notes(item),
-                    'OTPAuth': self.extract_otp(item)
-                }
-
-                writer.writerow(row)
-
-        # Count actual rows written (excluding header)
-        self.stats["password_items"] = len(password_items)
-        print(f"Exported {self.stats['password_items']} password items to: {self.passwords_csv_path}")
+    @staticmethod
+    def vault_id(account: Dict[str, Any], vault: Dict[str, Any]) -> str:
+        """The vault's uuid, or account and vault name when the export has no vault uuid."""
+        vault_attrs = vault.get("attrs", {})
+        if vault_attrs.get("uuid"):
+            return vault_attrs["uuid"]
+        account_attrs = account.get("attrs", {})
+        account_id = account_attrs.get("uuid") or account_attrs.get("accountName", "Unknown")
+        return f"{account_id}/{vault_attrs.get('name', 'Unknown')}"
+
+    def build_record(self, vault_name: str, item: Dict[str, Any], vault_id: Optional[str] = None) -> ExportRecord:
+        """Run every extractor once for an item."""
+        category_uuid = item.get("categoryUuid", "unknown")
+        return ExportRecord(
+            vault_name,
+            item,
+            category_uuid,
+            self.CATEGORY_NAMES.get(category_uuid, f"Category_{category_uuid}"),
+            item.get("overview", {}).get("title", "Untitled"),
+            self.extract_url(item),
+            self.extract_username(item),
+            self.extract_password(item),
+            self.extract_notes(item),
+            self.extract_otp(item),
+            vault_id
+        )
+
+    def build_records(self, vault_name: str, chunk: List[Dict[str, Any]],
+                      vault_id: Optional[str] = None) -> List[ExportRecord]:
+        """Build records for a chunk of items from one vault (runs on the render worker threads)."""
+        return [self.build_record(vault_name, item, vault_id) for item in chunk]
+
+    def iter_records(self, vault_name: str, items: List[Dict[str, Any]], executor: ThreadPoolExecutor,
+                     vault_id: Optional[str] = None):
+        """Yield records for a vault's items in order, built ahead in chunks on the executor.
+
+        The number of chunks built ahead shrinks under memory pressure (down to one: no read-ahead).
+        """
+        chunks = (items[start:start + self.RENDER_CHUNK_SIZE]
+                  for start in range(0, len(items), self.RENDER_CHUNK_SIZE))
+        pending = deque()
+
+        while True:
+            while len(pending) < self.governor.throttle(self.render_workers * 2):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append(executor.submit(self.build_records, vault_name, chunk, vault_id))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+    def record_sections(self, record: ExportRecord) -> List[Tuple[str, List[Tuple[str, str, bool]]]]:
+        """Formatted section fields of a record: [(section title, [(field title, value, concealed)])].
+
+        Attachment fields, untitled fields and empty values are left out, and so are sections
+        left without fields. Computed once per record and shared by every sink.
+        """
+        if record.sections is not None:
+            return record.sections
+
+        record.sections = []
+        self._pending_reference_seen = False
+        for section in record.item.get("details", {}).get("sections", []):
+            section_fields = []
+
+            for field in section.get("fields", []):
+                field_title = field.get("title", "")
+                field_value = field.get("value", "")
+
+                # Skip fields that are file attachments (they'll be listed in ATTACHMENTS section)
+                if isinstance(field_value, dict) and "file" in field_value:
+                    continue
+
+                # Skip fields with no title (usually auto-generated fields)
+                if not field_title:
+                    continue
+
+                # Format the field value first
+                formatted_value = self.format_field_value(field_value)
+
+                # Skip only if formatted value is empty, None, or placeholder text after formatting
+                if not formatted_value or formatted_value.strip() in ["", "(empty)", "None"]:
+                    continue
+
+                concealed = isinstance(field_value, dict) and "concealed" in field_value
+                section_fields.append((field_title, formatted_value, concealed))
+
+            # Only keep section if it has content
+            if section_fields:
+                record.sections.append((section.get("title", ""), section_fields))
+
+        record.pending_references = self._pending_reference_seen
+        return record.sections
+
+    def record_fields(self, record: ExportRecord):
+        """Yield (section title, field title, value, concealed) for every formatted field of a record."""
+        for section_title, section_fields in self.record_sections(record):
+            for field_title, value, concealed in section_fields:
+                yield section_title, field_title, value, concealed
+
+    def create_sinks(self, zip_ref: zipfile.ZipFile) -> List[ExportSink]:
+        """Open one sink per requested output format."""
+        sinks = []
+        if "text" in self.formats:
+            sinks.append(TextTreeSink(self, zip_ref))
+        if "apple-csv" in self.formats:
+            sinks.append(PasswordCsvSink(self))
+        if "bitwarden" in self.formats:
+            sinks.append(BitwardenJsonSink(self, self.bitwarden_json_path))
+        if "keepass" in self.formats:
+            sinks.append(KeePassXmlSink(self, self.keepass_xml_path))
+        return sinks
+
+    def record_duplicate_groups(self, credential_index: CredentialIndex):
+        """Count duplicate groups for the summary and optionally write the duplicate report."""
+        groups = credential_index.duplicate_groups()
+
+        counts = {}
+        for group_type, _, _ in groups:
+            counts[group_type] = counts.get(group_type, 0) + 1
+        self.stats["duplicate_groups"] = counts
+
+        if not self.duplicate_report:
+            return
+
+        # The report never contains passwords - only titles as written to the CSV
+        with open(self.duplicate_report_path, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+            writer.writerow(['Type', 'Key', 'Count', 'Titles'])
+            for group_type, key, titles in groups:
+                writer.writerow([group_type, key, len(titles), " | ".join(titles)])
+
+        print(f"Duplicate report ({len(groups)} groups) written to: {self.duplicate_report_path}")
 
     def sanitize_filename(self, filename: str) -> str:
         """Sanitize filename to be filesystem-safe."""
@@ -283,8 +1584,8 @@ class PasswordExporter:
                 # Menu selection
                 return f"{indent_str}{value['menu']}"
             elif "reference" in value:
-                # Reference to another item
-                return f"{indent_str}[Reference: {value['reference']}]"
+                # Reference to another item - resolved to its title and location when indexed
+                return f"{indent_str}{self.format_reference(value['reference'])}"
             else:
                 # Nested object without known type wrapper
                 # Check if it's a simple key-value that should be extracted
@@ -301,7 +1602,7 @@ class PasswordExporter:
                     # Skip common metadata fields
                     if k in ['provider', 'Provider']:
                         continue
-                    formatted_key = k.replace("_", " ").replace("Address", "").replace("address", "").title().strip()
+                    formatted_key = normalize_label(k)
                     if not formatted_key:
                         continue
                     formatted_val = self.format_field_value(v, indent + 1)
@@ -316,14 +1617,52 @@ class PasswordExporter:
         else:
             return f"{indent_str}{value}"
 
-    def export_non_password_item(self, item: Dict[str, Any], category_name: str, zip_ref: zipfile.ZipFile):
-        """Export a single non-password item as human-readable text with attachments in a folder."""
-        category_dir = os.path.join(self.non_password_dir, self.sanitize_filename(category_name))
+    def format_reference(self, item_uuid: str) -> str:
+        """Resolve a reference field, or emit a placeholder for the fix-up pass."""
+        described = self.item_index.describe(item_uuid)
+        if described is not None:
+            self.stats["references_resolved"] += 1
+            return described
+        self._pending_reference_seen = True
+        self._pending_references[item_uuid] = self._pending_references.get(item_uuid, 0) + 1
+        return f"[Reference: {item_uuid}]"
+
+    def resolve_pending_references(self, sinks: List[ExportSink]):
+        """Fix-up pass: replace placeholders for references to items indexed later in the export.
+
+        Only files that were written with a placeholder are rewritten, one line at a time.
+        References to items missing from the export keep the raw uuid.
+        """
+        for item_uuid, count in self._pending_references.items():
+            if item_uuid in self.item_index.entries:
+                self.stats["references_deferred"] += count
+            else:
+                self.stats["references_unresolved"] += count
+        self._pending_references = {}
+
+        for path, escape in [entry for sink in sinks for entry in sink.pending_reference_files()]:
+            def replace(match):
+                described = self.item_index.describe(match.group(1))
+                return match.group(0) if described is None else escape(described)
+
+            temp_path = f"{path}.references"
+            with open(path, 'r', encoding='utf-8', newline='') as source, \
+                    open(temp_path, 'w', encoding='utf-8', newline='') as target:
+                for line in source:
+                    target.write(ItemIndex.PLACEHOLDER.sub(replace, line))
+            os.replace(temp_path, path)
+        self.pending_reference_documents = []
+
+    def export_non_password_item(self, record: ExportRecord, zip_ref: zipfile.ZipFile) -> str:
+        """Export a single non-password item as human-readable text with attachments in a folder.
+
+        Returns the path of the text file. It is written by write_item_document once the
+        item's attachments have been written, which for large attachments is after the pass.
+        """
+        category_dir = os.path.join(self.non_password_dir, self.sanitize_filename(record.category_name))
         os.makedirs(category_dir, exist_ok=True)
 
-        overview = item.get("overview", {})
-        title = overview.get("title", "Untitled")
-        safe_title = self.sanitize_filename(title)
+        safe_title = self.sanitize_filename(record.title)
 
         # Create folder for this item (use title only, handle duplicates with counter)
         item_folder = os.path.join(category_dir, safe_title)
@@ -337,141 +1676,168 @@ class PasswordExporter:
 
         os.makedirs(item_folder, exist_ok=True)
 
-        # Create text filename using item title
-        text_filename = f"{safe_title}.txt"
+        # Create text filename using item title (the extension follows the category's template)
+        text_filename = f"{safe_title}{self.template_for(record).extension}"
         text_path = os.path.join(item_folder, text_filename)
 
-        # Build human-readable text content
-        content_lines = []
-        content_lines.append(f"{title}")
-        content_lines.append("")
-
-        # Basic metadata
-        content_lines.append("BASIC INFORMATION")
-        content_lines.append(f"Category: {category_name}")
-
-        url = self.extract_url(item)
-        if url:
-            content_lines.append(f"URL: {url}")
-
-        content_lines.append("")
-
-        # Notes section
-        notes = self.extract_notes(item)
-        if notes:
-            content_lines.append("NOTES")
-            content_lines.append(notes)
-            content_lines.append("")
-
-        # Details section - parse all fields
-        details = item.get("details", {})
-        sections = details.get("sections", [])
-
-        if sections:
-            # Collect detail lines first to check if there's any content
-            detail_lines = []
-
-            for section in sections:
-                section_title = section.get("title", "")
-                section_lines = []
-
-                fields = section.get("fields", [])
-                for field in fields:
-                    field_title = field.get("title", "")
-                    field_value = field.get("value", "")
-
-                    # Skip fields that are file attachments (they'll be listed in ATTACHMENTS section)
-                    if isinstance(field_value, dict) and "file" in field_value:
-                        continue
-
-                    # Skip fields with no title (usually auto-generated fields)
-                    if not field_title:
-                        continue
-
-                    # Format the field value first
-                    formatted_value = self.format_field_value(field_value)
-
-                    # Skip only if formatted value is empty, None, or placeholder text after formatting
-                    if not formatted_value or formatted_value.strip() in ["", "(empty)", "None"]:
-                        continue
-
-                    section_lines.append(f"{field_title}: {formatted_value}")
-
-                # Only add section if it has content
-                if section_lines:
-                    if section_title:
-                        detail_lines.append(f"\n{section_title}:")
-                    detail_lines.extend(section_lines)
-
-            # Only add DETAILS header if there's actual content
-            if detail_lines:
-                content_lines.append("DETAILS")
-                content_lines.extend(detail_lines)
-                content_lines.append("")
+        # Reserve the document's name so an attachment with the same name gets a suffix
+        document = ItemDocument(record, text_path)
+        self.attachment_writer.pending_paths.add(text_path)
 
         # Check for attachments and extract them to the same folder
-        attachment_files = self.extract_attachment_to_folder(zip_ref, item, item_folder)
-
-        if attachment_files:
-            content_lines.append("ATTACHMENTS")
-            content_lines.append(f"This item has {len(attachment_files)} attachment(s) in this folder:")
-            content_lines.append("")
-            for filename in attachment_files:
-                content_lines.append(f"  • {filename}")
-            content_lines.append("")
-
-        # Write text file
-        with open(text_path, 'w', encoding='utf-8') as f:
-            f.write("\n".join(content_lines))
+        document.attachment_files = self.extract_attachment_to_folder(zip_ref, record.item, item_folder,
+                                                                      record.vault_name, document)
+        document.sealed = True
+        if document.outstanding == 0:
+            self.write_item_document(document)
 
         self.stats["non_password_items"] += 1
-
-    def extract_single_file(self, zip_ref: zipfile.ZipFile, document_id: str, filename: str, item_folder: str) -> Optional[str]:
-        """Extract a single file from the archive. Returns the extracted filename or None."""
+        return text_path
+
+    def write_item_document(self, document: ItemDocument):
+        """Write an item's text file, listing only the attachments that were written."""
+        attachment_files = [name for name in document.attachment_files if name not in document.failed_files]
+        with open(document.path, 'w', encoding='utf-8') as f:
+            f.write(self.render_item_text(document.record, attachment_files))
+        self.attachment_writer.pending_paths.discard(document.path)
+        # Rendering formats the sections, so the placeholder flag is only known now
+        if document.record.pending_references:
+            self.pending_reference_documents.append(document.path)
+
+    def load_templates(self, template_dir: Optional[str]) -> Dict[str, ItemTemplate]:
+        """Compile the layout of every category once: category name -> ItemTemplate.
+
+        Files in template_dir named after a category ("Credit Card.md") or "default" (any
+        extension) replace the built-in text layout for that category or for all others.
+        Raises ValueError for unreadable or invalid templates.
+        """
+        sources = {}
+        if template_dir:
+            stems = {name.lower(): name for name in list(self.CATEGORY_NAMES.values()) + ["default"]}
+            for entry in sorted(os.scandir(template_dir), key=lambda entry: entry.name):
+                stem, extension = os.path.splitext(entry.name)
+                if not entry.is_file() or stem.lower() not in stems:
+                    continue
+                name = stems[stem.lower()]
+                if name in sources:
+                    raise ValueError(f"More than one template for {name} in {template_dir}")
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        sources[name] = (f.read(), extension or ".txt")
+                except (OSError, UnicodeDecodeError) as e:
+                    raise ValueError(f"Cannot read template {entry.path}: {str(e)}")
+
+        compiled = {}
+        default_source, default_extension = sources.get("default", (ItemTemplate.DEFAULT_SOURCE, ".txt"))
+        templates = {"default": ItemTemplate(default_source, default_extension)}
+        for category_name in self.CATEGORY_NAMES.values():
+            if category_name not in sources:
+                templates[category_name] = templates["default"]
+                continue
+            # Categories sharing a template file's content share its compiled function
+            key = sources[category_name]
+            if key not in compiled:
+                compiled[key] = ItemTemplate(key[0], key[1], category_name)
+            templates[category_name] = compiled[key]
+        return templates
+
+    def template_for(self, record: ExportRecord) -> ItemTemplate:
+        return self.templates.get(record.category_name, self.templates["default"])
+
+    def render_item_text(self, record: ExportRecord, attachment_files: List[str]) -> str:
+        """Build the human-readable document for a non-password item from its category template."""
+        return self.template_for(record).render(record, self.record_sections(record), attachment_files)
+
+    def extract_single_file(self, zip_ref: zipfile.ZipFile, document_id: str, filename: str, item_folder: str,
+                            item_uuid: Optional[str] = None, vault_name: Optional[str] = None,
+                            document: Optional[ItemDocument] = None) -> Optional[str]:
+        """Queue a single file from the archive for extraction. Returns the extracted filename or None.
+
+        The data is written by self.attachment_writer (see record_attachment), which then
+        completes the item's document. Failures are recorded in the event journal against
+        item_uuid and vault_name.
+        """
         try:
-            # Try to find the file in the archive
-            for zip_info in zip_ref.filelist:
-                if zip_info.filename.startswith(f"files/{document_id}"):
-                    safe_filename = self.sanitize_filename(filename)
-                    output_path = os.path.join(item_folder, safe_filename)
-
-                    # Handle duplicate filenames
-                    counter = 1
-                    base_name, ext = os.path.splitext(safe_filename)
-                    while os.path.exists(output_path):
-                        safe_filename = f"{base_name}_{counter}{ext}"
-                        output_path = os.path.join(item_folder, safe_filename)
-                        counter += 1
-
-                    with zip_ref.open(zip_info.filename) as source, open(output_path, 'wb') as target:
-                        target.write(source.read())
-
-                    self.stats["attachments_extracted"] += 1
-                    return safe_filename
-
-            self.stats["errors"].append(f"Attachment not found in archive: {filename} (ID: {document_id})")
-            return None
+            zip_info = self.find_attachment_member(self.attachment_index, document_id)
+            if zip_info is None:
+                self.failed_attachments.append({"item": item_uuid, "filename": filename, "member": None,
+                                                "reason": "missing_in_archive"})
+                self.journal.error("export_items", "AttachmentNotFound",
+                                   f"Attachment not found in archive: {filename} (ID: {document_id})",
+                                   item_uuid, vault_name)
+                return None
+
+            safe_filename = self.sanitize_filename(filename)
+            output_path = os.path.join(item_folder, safe_filename)
+
+            # Handle duplicate filenames
+            counter = 1
+            base_name, ext = os.path.splitext(safe_filename)
+            while os.path.exists(output_path) or output_path in self.attachment_writer.pending_paths:
+                safe_filename = f"{base_name}_{counter}{ext}"
+                output_path = os.path.join(item_folder, safe_filename)
+                counter += 1
+
+            relative_path = os.path.relpath(output_path, self.output_dir).replace(os.sep, "/")
+            if document is not None:
+                document.outstanding += 1
+            self.attachment_writer.submit(zip_info, output_path, (relative_path, zip_info.filename, filename,
+                                                                  safe_filename, item_uuid, vault_name, document))
+            return safe_filename
 
         except Exception as e:
-            self.stats["errors"].append(f"Error extracting attachment {filename}: {str(e)}")
+            self.failed_attachments.append({"item": item_uuid, "filename": filename, "member": None,
+                                            "reason": f"{type(e).__name__}: {str(e)}"})
+            self.journal.error("export_items", type(e).__name__,
+                               f"Error extracting attachment {filename}: {str(e)}", item_uuid, vault_name)
             return None
 
-    def extract_attachment_to_folder(self, zip_ref: zipfile.ZipFile, item: Dict[str, Any], item_folder: str) -> List[str]:
-        """Extract file attachments to the item's folder. Returns list of extracted filenames."""
-        extracted_files = []
+    def record_attachment(self, context: AttachmentContext, error: Optional[Exception], large: bool):
+        """Count a written attachment, or journal why it could not be written.
+
+        Writes the item's document once this was its last outstanding attachment.
+        """
+        relative_path, member, filename, safe_filename, item_uuid, vault_name, document = context
+        if error is None:
+            self.extracted_attachments.append((relative_path, member))
+            self.stats["attachments_extracted"] += 1
+        else:
+            self.failed_attachments.append({"item": item_uuid, "filename": filename, "member": member,
+                                            "reason": f"{type(error).__name__}: {str(error)}"})
+            self.journal.error("write_attachments" if large else "export_items", type(error).__name__,
+                               f"Error extracting attachment {filename}: {str(error)}", item_uuid, vault_name)
+
+        if document is not None:
+            if error is not None:
+                document.failed_files.add(safe_filename)
+            document.outstanding -= 1
+            if document.sealed and document.outstanding == 0:
+                self.write_item_document(document)
+
+    def write_attachment_manifest(self):
+        """Record which archive member each extracted attachment came from, and which referenced
+        attachments could not be extracted (both read by --verify). Written for every export,
+        with no entries when the text output (and so no attachment) is not selected."""
+        manifest = {
+            "archive": os.path.basename(self.input_file),
+            "attachments": [{"path": path, "member": member} for path, member in self.extracted_attachments],
+            "failed": self.failed_attachments
+        }
+        with open(self.attachment_manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    def iter_attachment_refs(self, item: Dict[str, Any]):
+        """Yield (document ID, file name) for every file attachment of an item."""
         details = item.get("details", {})
 
-        # Extract from documentAttributes (Document category items)
+        # Attachments from documentAttributes (Document category items)
         doc_attrs = details.get("documentAttributes")
         if doc_attrs:
             document_id = doc_attrs.get("documentId")
-            filename = doc_attrs.get("fileName", "unknown")
             if document_id:
-                result = self.extract_single_file(zip_ref, document_id, filename, item_folder)
-                if result:
-                    extracted_files.append(result)
+                yield document_id, doc_attrs.get("fileName", "unknown")
 
-        # Extract from field values in sections (e.g., Secure Notes with attachments)
+        # Attachments from field values in sections (e.g., Secure Notes with attachments)
         sections = details.get("sections", [])
         for section in sections:
             fields = section.get("fields", [])
@@ -480,14 +1846,193 @@ class PasswordExporter:
                 if isinstance(field_value, dict) and "file" in field_value:
                     file_info = field_value["file"]
                     document_id = file_info.get("documentId")
-                    filename = file_info.get("fileName", "unknown")
                     if document_id:
-                        result = self.extract_single_file(zip_ref, document_id, filename, item_folder)
-                        if result:
-                            extracted_files.append(result)
+                        yield document_id, file_info.get("fileName", "unknown")
+
+    def extract_attachment_to_folder(self, zip_ref: zipfile.ZipFile, item: Dict[str, Any], item_folder: str,
+                                     vault_name: Optional[str] = None,
+                                     document: Optional[ItemDocument] = None) -> List[str]:
+        """Extract file attachments to the item's folder. Returns list of extracted filenames."""
+        extracted_files = []
+
+        for document_id, filename in self.iter_attachment_refs(item):
+            result = self.extract_single_file(zip_ref, document_id, filename, item_folder,
+                                              item.get("uuid"), vault_name, document)
+            if result:
+                extracted_files.append(result)
 
         return extracted_files
 
+    def build_attachment_index(self, zip_ref: zipfile.ZipFile) -> Tuple[List[str], List[zipfile.ZipInfo]]:
+        """Sort the archive's files/ members by name for prefix lookups by document ID."""
+        members = sorted((info for info in zip_ref.infolist() if info.filename.startswith("files/")),
+                         key=lambda info: info.filename)
+        return [info.filename for info in members], members
+
+    def find_attachment_member(self, attachment_index: Tuple[List[str], List[zipfile.ZipInfo]],
+                               document_id: str) -> Optional[zipfile.ZipInfo]:
+        """Find the archive member for a document ID (first member whose name starts with files/<ID>)."""
+        names, members = attachment_index
+        prefix = f"files/{document_id}"
+        position = bisect.bisect_left(names, prefix)
+        if position < len(names) and names[position].startswith(prefix):
+            return members[position]
+        return None
+
+    def plan_export(self) -> bool:
+        """Estimate output size, inode count and runtime from metadata only - nothing is written."""
+        print(f"Planning export of: {self.input_file}")
+
+        try:
+            with zipfile.ZipFile(self.input_file, 'r') as zip_ref:
+                attachment_index = self.build_attachment_index(zip_ref)
+
+                # Decompressing and parsing export.data is the only read; it also calibrates throughput
+                started = time.perf_counter()
+                data_info = zip_ref.getinfo('export.data')
+                with zip_ref.open(data_info) as data_file:
+                    data = json.load(data_file)
+                parse_seconds = max(time.perf_counter() - started, 1e-6)
+
+                category_counts = {}
+                category_dirs = set()
+                item_folders = set()
+                text_bytes = 0
+                attachment_files = 0
+                attachment_bytes = 0
+                missing_attachments = 0
+                password_rows = []
+
+                for account in data.get("accounts", []):
+                    for vault in account.get("vaults", []):
+                        vault_name = vault.get("attrs", {}).get("name", "Unknown")
+
+                        for item in vault.get("items", []):
+                            record = self.build_record(vault_name, item)
+                            category_counts[record.category_name] = category_counts.get(record.category_name, 0) + 1
+
+                            if record.category_uuid == "005":
+                                continue
+
+                            if self.is_password_item(item):
+                                password_rows.append(record)
+                                continue
+
+                            if "text" not in self.formats:
+                                continue
+
+                            # Mirror export_non_password_item's folder naming to count directories
+                            category_dir = self.sanitize_filename(record.category_name)
+                            category_dirs.add(category_dir)
+                            safe_title = self.sanitize_filename(record.title)
+                            folder = (category_dir, safe_title)
+                            counter = 2
+                            while folder in item_folders:
+                                folder = (category_dir, f"{safe_title}_{counter}")
+                                counter += 1
+                            item_folders.add(folder)
+
+                            filenames = []
+                            for document_id, filename in self.iter_attachment_refs(item):
+                                member = self.find_attachment_member(attachment_index, document_id)
+                                if member is None:
+                                    missing_attachments += 1
+                                    continue
+                                attachment_files += 1
+                                attachment_bytes += member.file_size
+                                filenames.append(self.sanitize_filename(filename))
+
+                            text_bytes += len(self.render_item_text(record, filenames).encode("utf-8"))
+
+        except Exception as e:
+            print(f"Error planning 1pux export: {str(e)}")
+            return False
+
+        # CSV rows are rendered in memory and routed through the shard logic without opening files
+        fieldnames = PasswordCsvSink.FIELDNAMES
+        shard_router = ShardedCsvWriter(self.passwords_csv_path, fieldnames, self.shard_by, self.shard_size)
+        csv_paths = set()
+        csv_bytes = 0
+        csv_files = 0
+        if "apple-csv" in self.formats:
+            for record in password_rows:
+                csv_row = (record.title, record.url, record.username, record.password, record.notes, record.otp)
+                csv_paths.add(shard_router.shard_for(csv_row, record.vault_name, record.url))
+                csv_bytes += ShardedCsvWriter.row_bytes(csv_row)
+            csv_files = max(len(csv_paths), 1)
+            csv_bytes += csv_files * ShardedCsvWriter.row_bytes(tuple(fieldnames))
+
+        # Every file occupies whole filesystem blocks; every directory at least one.
+        # Single files besides the CSV and item folders are counted; their size is not estimated.
+        directories = 1 + (1 if "text" in self.formats else 0) + len(category_dirs) + len(item_folders)
+        single_files = [self.journal_path, self.attachment_manifest_path]
+        if "apple-csv" in self.formats and self.duplicate_report:
+            single_files.append(self.duplicate_report_path)
+        if "bitwarden" in self.formats:
+            single_files.append(self.bitwarden_json_path)
+        if "keepass" in self.formats:
+            single_files.append(self.keepass_xml_path)
+        if self.verify:
+            single_files.append(AttachmentVerifier.REPORT_NAME)
+            if self.sha256:
+                single_files.append(AttachmentVerifier.SHA256_MANIFEST_NAME)
+        files = csv_files + len(single_files) + len(item_folders) + attachment_files
+        target = os.path.abspath(self.output_dir)
+        while not os.path.exists(target):
+            target = os.path.dirname(target)
+        block_size = os.statvfs(target).f_frsize if hasattr(os, "statvfs") else 4096
+        payload_bytes = csv_bytes + text_bytes + attachment_bytes
+        required_bytes = int((payload_bytes + (files + directories) * block_size) * self.PLAN_SPACE_MARGIN)
+
+        # Runtime: measured inflate + parse rate for the data, fixed estimates for disk writes
+        inflate_rate = data_info.file_size / parse_seconds
+        estimated_seconds = (parse_seconds
+                             + attachment_bytes / inflate_rate
+                             + payload_bytes / self.PLAN_WRITE_BYTES_PER_SECOND
+                             + (files + directories) * self.PLAN_SECONDS_PER_INODE)
+
+        print("\n" + "="*60)
+        print("EXPORT PLAN (nothing has been written)")
+        print("="*60)
+        print("Items per category:")
+        for category_name, count in sorted(category_counts.items(), key=lambda entry: (-entry[1], entry[0])):
+            print(f"  {category_name}: {count}")
+        if "apple-csv" in self.formats:
+            print(f"\nPasswords CSV: {len(password_rows)} rows in {csv_files} file(s), ~{format_bytes(csv_bytes)}")
+        else:
+            print(f"\nLogin items: {len(password_rows)}")
+        print(f"Non-password items: {len(item_folders)} folders in {len(category_dirs)} categories, "
+              f"~{format_bytes(text_bytes)} of text")
+        print(f"Attachments: {attachment_files} files, {format_bytes(attachment_bytes)} uncompressed")
+        if missing_attachments:
+            print(f"  ({missing_attachments} referenced attachments are missing from the archive)")
+        print(f"Filesystem entries to create: {directories} directories, {files} files")
+        print(f"Space required (incl. block overhead and margin): {format_bytes(required_bytes)}")
+        print(f"Estimated runtime: {estimated_seconds:.1f}s "
+              f"(calibrated inflate + parse rate {format_bytes(inflate_rate)}/s)")
+
+        # Fail fast when the target filesystem cannot hold the export
+        free_bytes = shutil.disk_usage(target).free
+        print(f"Free space at {target}: {format_bytes(free_bytes)}")
+        problems = []
+        if free_bytes < required_bytes:
+            problems.append(f"Not enough free space - need {format_bytes(required_bytes)}, "
+                            f"have {format_bytes(free_bytes)}.")
+        if hasattr(os, "statvfs"):
+            # Filesystems without inode limits report 0 free inodes
+            free_inodes = os.statvfs(target).f_favail
+            if free_inodes and free_inodes < files + directories:
+                problems.append(f"Only {free_inodes} free inodes, {files + directories} needed.")
+        if problems:
+            for problem in problems:
+                print(f"Error: {problem}")
+            print("="*60)
+            return False
+
+        print("Free space check: OK")
+        print("="*60)
+        return True
+
     def process_1pux_file(self):
         """Main processing function to parse and export 1pux data."""
         print(f"Processing 1Password export file: {self.input_file}")
@@ -504,40 +2049,59 @@ class PasswordExporter:
 
                 # Read main data
                 data = json.loads(zip_ref.read('export.data').decode('utf-8'))
+                self.mark_stage("parse")
 
-                # Process all accounts and vaults
-                all_items = []
+                # Attachments are looked up by document ID and written by a size-tiered writer
+                self.attachment_index = self.build_attachment_index(zip_ref)
+                self.attachment_writer = AttachmentWriter(zip_ref, self.governor, self.record_attachment,
+                                                          self.attachment_workers, self.large_attachment_workers,
+                                                          self.large_attachment_size)
 
-                for account in data.get("accounts", []):
-                    account_name = account.get("attrs", {}).get("accountName", "Unknown")
-                    print(f"\nProcessing account: {account_name}")
+                # Every item is parsed once and fanned out to all output sinks
+                sinks = self.create_sinks(zip_ref)
 
-                    for vault in account.get("vaults", []):
-                        vault_name = vault.get("attrs", {}).get("name", "Unknown")
-                        print(f"  Processing vault: {vault_name}")
+                with ThreadPoolExecutor(max_workers=self.render_workers) as executor:
+                    for account in data.get("accounts", []):
+                        account_name = account.get("attrs", {}).get("accountName", "Unknown")
+                        print(f"\nProcessing account: {account_name}")
 
-                        items = vault.get("items", [])
-                        all_items.extend(items)
+                        for vault in account.get("vaults", []):
+                            vault_name = vault.get("attrs", {}).get("name", "Unknown")
+                            print(f"  Processing vault: {vault_name}")
 
-                        for idx, item in enumerate(items):
-                            self.stats["total_items"] += 1
-                            category_uuid = item.get("categoryUuid", "unknown")
-                            category_name = self.CATEGORY_NAMES.get(category_uuid, f"Category_{category_uuid}")
+                            items = vault.get("items", [])
+                            self.stats["total_items"] += len(items)
 
-                            # Skip category 005 (Password) - unused generated passwords
-                            if category_uuid == "005":
-                                self.stats["skipped_items"] += 1
-                                continue
+                            for record in self.iter_records(vault_name, items, executor,
+                                                            self.vault_id(account, vault)):
+                                self.item_index.add(record.item.get("uuid"), record.title,
+                                                    record.category_name, f"vault {vault_name}")
+
+                                # Skip category 005 (Password) - unused generated passwords
+                                if record.category_uuid == "005":
+                                    self.stats["skipped_items"] += 1
+                                    continue
+
+                                for sink in sinks:
+                                    if sink.accepts(record):
+                                        sink.write(record)
+
+                self.mark_stage("export_items")
 
-                            if not self.is_password_item(item):
-                                # Export non-password data (includes attachment extraction)
-                                self.export_non_password_item(item, category_name, zip_ref)
+                for sink in sinks:
+                    sink.close()
+                self.attachment_writer.close()
+                self.mark_stage("write_attachments")
 
-                # Export all passwords to CSV
-                self.export_passwords_to_csv(all_items)
+                self.resolve_pending_references(sinks)
+                self.write_attachment_manifest()
+                self.mark_stage("finish_outputs")
 
         except Exception as e:
+            if self.attachment_writer is not None:
+                self.attachment_writer.abort()
             print(f"Error processing 1pux file: {str(e)}")
+            self.journal.error("process", type(e).__name__, str(e))
             import traceback
             traceback.print_exc()
             return False
@@ -555,34 +2119,828 @@ class PasswordExporter:
         print(f"Items skipped (category 005 - unused passwords): {self.stats['skipped_items']}")
         print(f"Attachments extracted: {self.stats['attachments_extracted']}")
 
-        if self.stats["errors"]:
-            print(f"\nErrors encountered: {len(self.stats['errors'])}")
-            for error in self.stats["errors"][:10]:
-                print(f"  - {error}")
-            if len(self.stats["errors"]) > 10:
-                print(f"  ... and {len(self.stats['errors']) - 10} more")
+        duplicate_groups = self.stats["duplicate_groups"]
+        if duplicate_groups or self.stats["duplicates_collapsed"]:
+            print(f"Exact duplicate logins: {duplicate_groups.get('exact_duplicate', 0)} groups"
+                  f" ({self.stats['duplicates_collapsed']} collapsed)")
+            print(f"Near-duplicate logins: {duplicate_groups.get('near_duplicate', 0)} groups")
+            print(f"Reused passwords: {duplicate_groups.get('reused_password', 0)} groups")
+
+        references = (self.stats["references_resolved"] + self.stats["references_deferred"]
+                      + self.stats["references_unresolved"])
+        if references:
+            print(f"Reference fields resolved: {self.stats['references_resolved'] + self.stats['references_deferred']}"
+                  f" of {references} ({self.stats['references_deferred']} forward references fixed up after export)")
+
+        journal = self.journal
+        if journal:
+            print(f"\nErrors encountered: {len(journal)}")
+            for error_class, count in sorted(journal.error_counts.items(), key=lambda entry: -entry[1]):
+                print(f"  {error_class}: {count}")
+            for message in journal.samples:
+                print(f"  - {message}")
+            if len(journal) > len(journal.samples):
+                print(f"  ... and {len(journal) - len(journal.samples)} more (see {journal.path})")
+
+        if self.governor.limit_bytes:
+            print(f"\nMemory limit: {format_bytes(self.governor.limit_bytes)}, "
+                  f"peak RSS: {format_bytes(self.governor.peak_rss)}"
+                  f"{' (spilled to disk)' if self.governor.spilled else ''}")
 
         print("\nOutput locations:")
-        print(f"  Passwords CSV: {self.passwords_csv_path}")
-        print(f"  Non-password data: {self.non_password_dir}")
-        print(f"    (Each item stored in its own folder with attachments)")
+        if "apple-csv" in self.formats:
+            if self.shard_by:
+                print(f"  Passwords CSV shards ({len(self.stats['csv_files'])}):")
+                for path in self.stats["csv_files"]:
+                    print(f"    {path}")
+            else:
+                print(f"  Passwords CSV: {self.passwords_csv_path}")
+            if self.duplicate_report:
+                print(f"  Duplicate report: {self.duplicate_report_path}")
+        if "text" in self.formats:
+            print(f"  Non-password data: {self.non_password_dir}")
+            print(f"    (Each item stored in its own folder with attachments)")
+        if "bitwarden" in self.formats:
+            print(f"  Bitwarden JSON: {self.bitwarden_json_path}")
+        if "keepass" in self.formats:
+            print(f"  KeePass XML: {self.keepass_xml_path}")
         print("="*60)
 
     def run(self) -> bool:
         """Execute the full export process."""
         if not self.validate_input_file():
             return False
+        self.mark_stage("validate")
+
+        if self.plan_only:
+            return self.plan_export()
 
         self.create_output_directories()
+        self.journal.open(self.journal_path)
+        self.mark_stage("prepare_outputs")
 
-        success = self.process_1pux_file()
+        try:
+            success = self.process_1pux_file()
 
-        if success:
-            self.print_summary()
+            if success:
+                self.print_summary()
+
+            if success and self.verify:
+                verifier = AttachmentVerifier(self.input_file, self.output_dir, sha256=self.sha256)
+                success = verifier.run()
+                self.mark_stage("verify")
+        finally:
+            self.journal.close()
+            self.item_index.close()
+            self.governor.close()
 
         return success
 
 
+class AttachmentVerifier:
+    """Check extracted attachments against the archive's central directory.
+
+    Each file listed in the attachment manifest is read in large blocks and its size and
+    CRC-32 are compared with the ZipInfo of the archive member it was extracted from
+    (optionally also computing SHA-256). Files are hashed in parallel: zlib and hashlib
+    release the GIL on large buffers. Nothing is decompressed from the archive.
+    Attachments the manifest records as not extracted (missing from the archive or failed
+    to write) count as failures, so an export that lost attachments never passes.
+    Results are written to verification_report.json (and sha256_manifest.txt with --sha256,
+    in sha256sum format).
+    """
+
+    MANIFEST_NAME = "attachment_manifest.json"
+    REPORT_NAME = "verification_report.json"
+    SHA256_MANIFEST_NAME = "sha256_manifest.txt"
+    READ_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, input_file: str, output_dir: str, workers: Optional[int] = None, sha256: bool = False):
+        self.input_file = input_file
+        self.output_dir = output_dir
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.sha256 = sha256
+        self.report_path = os.path.join(output_dir, self.REPORT_NAME)
+        self.sha256_manifest_path = os.path.join(output_dir, self.SHA256_MANIFEST_NAME)
+
+    def verify_file(self, entry: Dict[str, str], zip_info: Optional[zipfile.ZipInfo]) -> Dict[str, Any]:
+        """Hash one extracted file and compare it with its archive member."""
+        result = {"path": entry["path"], "member": entry["member"]}
+        if zip_info is None:
+            result["status"] = "missing_in_archive"
+            return result
+
+        result["expected_size"] = zip_info.file_size
+        result["expected_crc32"] = f"{zip_info.CRC:08x}"
+        path = os.path.join(self.output_dir, *entry["path"].split("/"))
+
+        crc = 0
+        size = 0
+        digest = hashlib.sha256() if self.sha256 else None
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    block = f.read(self.READ_SIZE)
+                    if not block:
+                        break
+                    crc = zlib.crc32(block, crc)
+                    size += len(block)
+                    if digest is not None:
+                        digest.update(block)
+        except OSError as e:
+            result["status"] = "missing_on_disk"
+            result["error"] = str(e)
+            return result
+
+        result["actual_size"] = size
+        result["actual_crc32"] = f"{crc:08x}"
+        if digest is not None:
+            result["sha256"] = digest.hexdigest()
+        if size != zip_info.file_size:
+            result["status"] = "size_mismatch"
+        elif crc != zip_info.CRC:
+            result["status"] = "crc_mismatch"
+        else:
+            result["status"] = "ok"
+        return result
+
+    def run(self) -> bool:
+        """Verify every manifest entry, write the reports and print a summary. True if all match."""
+        print(f"\nVerifying extracted attachments in: {self.output_dir}")
+        started = time.perf_counter()
+
+        manifest_path = os.path.join(self.output_dir, self.MANIFEST_NAME)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            entries = manifest["attachments"]
+            failed = manifest.get("failed", [])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error: Cannot read attachment manifest {manifest_path}: {str(e)}")
+            return False
+
+        try:
+            with zipfile.ZipFile(self.input_file, 'r') as zip_ref:
+                members = {info.filename: info for info in zip_ref.infolist()}
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"Error: Cannot read archive {self.input_file}: {str(e)}")
+            return False
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(lambda entry: self.verify_file(entry, members.get(entry["member"])),
+                                        entries))
+        for entry in failed:
+            results.append({"path": entry["filename"], "member": entry.get("member"), "item": entry.get("item"),
+                            "status": "not_extracted", "error": entry.get("reason")})
+
+        counts = {}
+        verified_bytes = 0
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            verified_bytes += result.get("actual_size", 0)
+        elapsed = time.perf_counter() - started
+        passed = counts.get("ok", 0) == len(results)
+
+        report = {
+            "archive": os.path.abspath(self.input_file),
+            "output_dir": os.path.abspath(self.output_dir),
+            "verified_at": datetime.now().isoformat(timespec="seconds"),
+            "passed": passed,
+            "summary": {"files": len(results), "bytes": verified_bytes, "seconds": round(elapsed, 3),
+                        "statuses": counts},
+            "files": results
+        }
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+        if self.sha256:
+            with open(self.sha256_manifest_path, 'w', encoding='utf-8') as f:
+                for result in results:
+                    if "sha256" in result:
+                        f.write(f"{result['sha256']}  {result['path']}\n")
+
+        print(f"Verified {len(results)} attachments ({format_bytes(verified_bytes)}) in {elapsed:.2f}s: "
+              f"{counts.get('ok', 0)} match the archive")
+        for result in results:
+            if result["status"] != "ok":
+                print(f"  ✗ {result['path']}: {result['status']}"
+                      f"{' (' + result['error'] + ')' if result.get('error') else ''}")
+        print(f"Verification report: {self.report_path}")
+        if self.sha256:
+            print(f"SHA-256 manifest: {self.sha256_manifest_path}")
+        return passed
+
+
+class ExportAttachment:
+    """A file attachment inside the .1pux archive, decompressed only when opened."""
+
+    def __init__(self, zip_ref: zipfile.ZipFile, member: zipfile.ZipInfo, document_id: str, filename: str):
+        self._zip_ref = zip_ref
+        self.member = member
+        self.document_id = document_id
+        self.filename = filename
+        self.size = member.file_size
+
+    def open(self) -> BinaryIO:
+        """Open a file-like stream that decompresses the attachment as it is read."""
+        return self._zip_ref.open(self.member)
+
+    def read(self) -> bytes:
+        with self.open() as stream:
+            return stream.read()
+
+
+class ExportDocument:
+    """A non-password item rendered as its human-readable text document, plus its attachments."""
+
+    def __init__(self, record: ExportRecord, text: str, attachments: List[ExportAttachment],
+                 missing_attachments: List[Tuple[str, str]]):
+        self.record = record
+        self.text = text
+        self.attachments = attachments
+        # (document ID, file name) for attachments referenced by the item but absent from the archive
+        self.missing_attachments = missing_attachments
+
+
+class ExportReader:
+    """Embeddable streaming API over a .1pux file.
+
+    Yields the same data the CLI writes, without touching the filesystem or printing:
+    ExportRecord objects for Login items and ExportDocument objects for everything else
+    (category 005 items are skipped, as in the CLI). Reference fields resolve to items
+    seen earlier in the export; forward references keep the "[Reference: <uuid>]"
+    placeholder, which reader.exporter.item_index.describe() can resolve once iteration
+    has finished. Attachments are ExportAttachment objects whose open() streams from the
+    archive, so nothing is decompressed unless read. The reader must stay open while
+    records and attachments are consumed:
+
+        with ExportReader("export.1pux") as reader:
+            for entry in reader:
+                if isinstance(entry, ExportRecord):
+                    store_login(entry.title, entry.url, entry.username, entry.password)
+                else:
+                    store_document(entry.record.title, entry.text)
+                    for attachment in entry.attachments:
+                        with attachment.open() as stream:
+                            store_file(attachment.filename, stream)
+    """
+
+    def __init__(self, input_file: str, render_workers: int = 1, memory_limit: Optional[int] = None):
+        # The exporter is only used for its extraction and rendering methods
+        self.exporter = PasswordExporter(input_file, render_workers=render_workers, memory_limit=memory_limit)
+        self.input_file = input_file
+        self.zip_ref = None
+        self.attributes = {}
+        self._attachment_index = None
+
+    def open(self) -> "ExportReader":
+        """Open the archive. Raises FileNotFoundError or ValueError for unusable input."""
+        if not os.path.exists(self.input_file):
+            raise FileNotFoundError(self.input_file)
+        if not zipfile.is_zipfile(self.input_file):
+            raise ValueError(f"Not a ZIP archive: {self.input_file}")
+
+        self.zip_ref = zipfile.ZipFile(self.input_file, 'r')
+        self.attributes = json.loads(self.zip_ref.read('export.attributes').decode('utf-8'))
+        self._attachment_index = self.exporter.build_attachment_index(self.zip_ref)
+        return self
+
+    def close(self):
+        if self.zip_ref is not None:
+            self.zip_ref.close()
+            self.zip_ref = None
+        self.exporter.item_index.close()
+        self.exporter.governor.close()
+
+    def __enter__(self) -> "ExportReader":
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __iter__(self):
+        """Yield ExportRecord (Login) and ExportDocument (other categories) entries in export order."""
+        if self.zip_ref is None:
+            self.open()
+
+        exporter = self.exporter
+        with self.zip_ref.open('export.data') as data_file:
+            data = json.load(data_file)
+
+        with ThreadPoolExecutor(max_workers=exporter.render_workers) as executor:
+            for account in data.get("accounts", []):
+                for vault in account.get("vaults", []):
+                    vault_name = vault.get("attrs", {}).get("name", "Unknown")
+
+                    for record in exporter.iter_records(vault_name, vault.get("items", []), executor,
+                                                        exporter.vault_id(account, vault)):
+                        exporter.item_index.add(record.item.get("uuid"), record.title,
+                                                record.category_name, f"vault {vault_name}")
+                        if record.category_uuid == "005":
+                            continue
+                        if exporter.is_password_item(record.item):
+                            yield record
+                        else:
+                            yield self.build_document(record)
+
+    def build_document(self, record: ExportRecord) -> ExportDocument:
+        """Resolve a record's attachments and render its text document."""
+        attachments = []
+        missing = []
+        used_names = set()
+
+        for document_id, filename in self.exporter.iter_attachment_refs(record.item):
+            member = self.exporter.find_attachment_member(self._attachment_index, document_id)
+            if member is None:
+                missing.append((document_id, filename))
+                continue
+
+            # Same naming as extract_single_file: sanitized, with _1, _2 for repeats
+            safe_filename = self.exporter.sanitize_filename(filename)
+            base_name, ext = os.path.splitext(safe_filename)
+            counter = 1
+            while safe_filename in used_names:
+                safe_filename = f"{base_name}_{counter}{ext}"
+                counter += 1
+            used_names.add(safe_filename)
+            attachments.append(ExportAttachment(self.zip_ref, member, document_id, safe_filename))
+
+        text = self.exporter.render_item_text(record, [attachment.filename for attachment in attachments])
+        return ExportDocument(record, text, attachments, missing)
+
+    def logins(self) -> Iterator[ExportRecord]:
+        """Yield only Login records."""
+        for entry in self:
+            if isinstance(entry, ExportRecord):
+                yield entry
+
+    def documents(self) -> Iterator[ExportDocument]:
+        """Yield only rendered non-password documents."""
+        for entry in self:
+            if isinstance(entry, ExportDocument):
+                yield entry
+
+    def attachments(self) -> Iterator[ExportAttachment]:
+        """Yield every attachment of every non-password document."""
+        for document in self.documents():
+            yield from document.attachments
+
+
+def file_sha256(path: str, read_size: int = 4 * 1024 * 1024) -> str:
+    """SHA-256 of a file's content, read in large blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(read_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_watch_job(input_file: str, output_dir: str, log_path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Export one archive inside a watch-daemon worker process. Returns the job metrics.
+
+    The export's console output goes to log_path so concurrent jobs do not interleave.
+    """
+    import contextlib
+    started = time.perf_counter()
+    exporter = PasswordExporter(input_file, output_dir=output_dir, **options)
+    with open(log_path, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        success = exporter.run()
+
+    stats = exporter.stats
+    return {
+        "success": success,
+        "seconds": round(time.perf_counter() - started, 3),
+        "total_items": stats["total_items"],
+        "password_items": stats["password_items"],
+        "non_password_items": stats["non_password_items"],
+        "attachments_extracted": stats["attachments_extracted"],
+        "errors": len(exporter.journal),
+        "worker_pid": os.getpid(),
+        "worker_rss": MemoryGovernor.read_rss()
+    }
+
+
+def ignore_interrupts():
+    """Watch-daemon worker initializer: Ctrl+C reaches the whole process group, but only the
+    daemon should react to it (by finishing queued exports)."""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class PollingWatcher:
+    """Report new files in a directory by scanning it; a file is reported once its size and
+    modification time are unchanged between two scans (so partially copied files are skipped)."""
+
+    def __init__(self, directory: str, interval: float):
+        self.directory = directory
+        self.interval = interval
+        self._last_seen = {}
+        self._reported = set()
+
+    def existing(self) -> List[str]:
+        """Files already in the directory at start-up; these are not reported again."""
+        paths = [entry.path for entry in os.scandir(self.directory) if entry.is_file()]
+        self._reported.update(paths)
+        return paths
+
+    def scan(self) -> List[str]:
+        ready = []
+        current = {}
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            current[entry.path] = (stat.st_size, stat.st_mtime)
+            if entry.path not in self._reported and self._last_seen.get(entry.path) == current[entry.path]:
+                self._reported.add(entry.path)
+                ready.append(entry.path)
+        # Forget deleted files so a file dropped again under the same name is picked up
+        self._reported &= set(current)
+        self._last_seen = current
+        return ready
+
+    def wait(self) -> List[str]:
+        time.sleep(self.interval)
+        return self.scan()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Report files closed after writing or moved into a directory, using Linux inotify via ctypes."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    EVENT_HEADER = "iIII"
+
+    def __init__(self, directory: str, interval: float):
+        import ctypes
+        import ctypes.util
+        import struct
+        self.directory = directory
+        self.interval = interval
+        self._struct = struct
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def existing(self) -> List[str]:
+        """Files already in the directory at start-up."""
+        return [entry.path for entry in os.scandir(self.directory) if entry.is_file()]
+
+    def wait(self) -> List[str]:
+        import select
+        readable, _, _ = select.select([self.fd], [], [], self.interval)
+        if not readable:
+            return []
+
+        buffer = os.read(self.fd, 64 * 1024)
+        header_size = self._struct.calcsize(self.EVENT_HEADER)
+        paths = []
+        offset = 0
+        while offset + header_size <= len(buffer):
+            _, _, _, name_length = self._struct.unpack_from(self.EVENT_HEADER, buffer, offset)
+            name = buffer[offset + header_size:offset + header_size + name_length].rstrip(b"\0")
+            offset += header_size + name_length
+            if name:
+                paths.append(os.path.join(self.directory, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WatchDaemon:
+    """Watch an inbox directory and export every new .1pux file with a warm worker pool.
+
+    Worker processes are started once and reused for every job, so each archive skips
+    interpreter start-up and module imports. Archives are identified by content hash:
+    a file whose SHA-256 has been exported before (recorded in watch_state.json, kept
+    across restarts) is skipped, whatever its name. Each job writes to
+    <output_root>/<archive name>_<hash prefix>/ with its console log next to it, and
+    appends its metrics to watch_jobs.ndjson; watch_metrics.json holds running totals.
+    """
+
+    STATE_NAME = "watch_state.json"
+    JOBS_LOG_NAME = "watch_jobs.ndjson"
+    METRICS_NAME = "watch_metrics.json"
+
+    def __init__(self, inbox_dir: str, output_root: str, jobs: int = 1, poll_interval: float = 2.0,
+                 once: bool = False, export_options: Optional[Dict[str, Any]] = None):
+        self.inbox_dir = inbox_dir
+        self.output_root = output_root
+        self.jobs = jobs
+        self.poll_interval = poll_interval
+        self.once = once
+        self.export_options = export_options or {}
+        self.state_path = os.path.join(output_root, self.STATE_NAME)
+        self.jobs_log_path = os.path.join(output_root, self.JOBS_LOG_NAME)
+        self.metrics_path = os.path.join(output_root, self.METRICS_NAME)
+        self.processed = {}
+        self.in_flight = {}
+        self.totals = {"started_at": datetime.now().isoformat(timespec="seconds"), "queued": 0,
+                       "succeeded": 0, "failed": 0, "skipped_duplicates": 0, "export_seconds": 0.0}
+        self._stop = threading.Event()
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.processed = json.load(f).get("processed", {})
+        except (OSError, ValueError):
+            self.processed = {}
+
+    def save_state(self):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"processed": self.processed}, f, indent=2)
+        os.replace(temp_path, self.state_path)
+
+    def make_watcher(self):
+        """inotify on Linux, polling everywhere else (or if inotify cannot be set up)."""
+        if sys.platform.startswith("linux"):
+            try:
+                return InotifyWatcher(self.inbox_dir, self.poll_interval)
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable ({str(e)}), falling back to polling")
+        return PollingWatcher(self.inbox_dir, self.poll_interval)
+
+    def enqueue(self, executor, path: str):
+        """Hash a new archive and submit it unless the same content was already exported."""
+        if not path.lower().endswith(".1pux") or not os.path.isfile(path):
+            return
+        try:
+            content_hash = file_sha256(path)
+        except OSError as e:
+            print(f"Cannot read {path}: {str(e)}")
+            return
+
+        if content_hash in self.processed or content_hash in self.in_flight.values():
+            self.totals["skipped_duplicates"] += 1
+            print(f"Skipping {os.path.basename(path)}: already exported (sha256 {content_hash[:12]})")
+            return
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        output_dir = os.path.join(self.output_root, f"{stem}_{content_hash[:12]}")
+        log_path = f"{output_dir}.log"
+        future = executor.submit(run_watch_job, path, output_dir, log_path, self.export_options)
+        future.job = {"file": path, "sha256": content_hash, "output_dir": output_dir, "log": log_path,
+                      "queued_at": datetime.now().isoformat(timespec="seconds")}
+        self.in_flight[future] = content_hash
+        self.totals["queued"] += 1
+        print(f"Queued {os.path.basename(path)} -> {output_dir}")
+
+    def collect(self, block: bool = False):
+        """Record metrics for finished jobs."""
+        from concurrent.futures import wait, FIRST_COMPLETED
+        if not self.in_flight:
+            return
+        done, _ = wait(list(self.in_flight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            content_hash = self.in_flight.pop(future)
+            job = dict(future.job)
+            try:
+                job.update(future.result())
+            except Exception as e:
+                job.update({"success": False, "error": str(e)})
+            self.record_job(job, content_hash)
+
+    def record_job(self, job: Dict[str, Any], content_hash: str):
+        """Update the state, job log and metrics for a finished (or abandoned) job."""
+        job["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        if job["success"]:
+            self.totals["succeeded"] += 1
+            self.processed[content_hash] = {"file": job["file"], "output_dir": job["output_dir"],
+                                            "finished_at": job["finished_at"]}
+            self.save_state()
+        else:
+            self.totals["failed"] += 1
+        self.totals["export_seconds"] = round(self.totals["export_seconds"] + job.get("seconds", 0), 3)
+
+        with open(self.jobs_log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(job, ensure_ascii=False) + "\n")
+        with open(self.metrics_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.totals, in_flight=len(self.in_flight)), f, indent=2)
+
+        status = "✓" if job["success"] else "✗"
+        print(f"{status} {os.path.basename(job['file'])}: {job.get('total_items', 0)} items in "
+              f"{job.get('seconds', 0):.2f}s (log: {job['log']})")
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def run(self) -> bool:
+        """Process the inbox until stopped (Ctrl+C or SIGTERM), or once with once=True.
+
+        Stopping finishes the exports already queued. Returns False if any job failed or
+        was abandoned.
+        """
+        import signal
+        from concurrent.futures import ProcessPoolExecutor
+
+        if not os.path.isdir(self.inbox_dir):
+            print(f"Error: Inbox directory '{self.inbox_dir}' does not exist.")
+            return False
+        os.makedirs(self.output_root, exist_ok=True)
+        self.load_state()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        print(f"Watching {self.inbox_dir} with {self.jobs} worker process(es); outputs in {self.output_root}")
+        watcher = self.make_watcher()
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs, initializer=ignore_interrupts) as executor:
+                # Archives already waiting in the inbox
+                for path in sorted(watcher.existing()):
+                    self.enqueue(executor, path)
+
+                while not self.once and not self._stop.is_set():
+                    for path in watcher.wait():
+                        self.enqueue(executor, path)
+                    self.collect()
+
+                if self._stop.is_set():
+                    print(f"\nStopping watch daemon after {len(self.in_flight)} queued export(s)...")
+                while self.in_flight:
+                    self.collect(block=True)
+        except KeyboardInterrupt:
+            print("\nWatch daemon interrupted")
+        finally:
+            watcher.close()
+            # Jobs that never reported back count as failed
+            for future, content_hash in list(self.in_flight.items()):
+                del self.in_flight[future]
+                self.record_job(dict(future.job, success=False, error="interrupted"), content_hash)
+
+        print(f"Watch daemon finished: {self.totals['succeeded']} exported, {self.totals['failed']} failed, "
+              f"{self.totals['skipped_duplicates']} duplicates skipped")
+        return self.totals["failed"] == 0
+
+
+class ExportProfiler:
+    """Profile an export run for --profile and --trace-memory.
+
+    --profile runs cProfile on the exporting thread and samples the stacks of all threads
+    for a flamegraph. --trace-memory takes a tracemalloc snapshot at every stage boundary.
+    Reports are written to a profile/ folder next to the export outputs:
+      - export.pstats         cProfile data (python3 -m pstats, snakeviz, ...)
+      - export_pstats.txt     top functions by cumulative time
+      - export.collapsed      collapsed stacks for flamegraph.pl / speedscope
+      - memory_stages.txt     traced memory and top allocations per stage
+    """
+
+    SAMPLE_INTERVAL = 0.001
+    TOP_N = 25
+
+    def __init__(self, profile: bool = False, trace_memory: bool = False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.stage_times = []
+        self.snapshots = []
+        self.stack_samples = {}
+        self._profiler = None
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self._started_at = 0.0
+        self._last_stage_at = 0.0
+
+    def start(self):
+        self._started_at = self._last_stage_at = time.perf_counter()
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+            self.snapshots.append(("start", tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()))
+        if self.profile:
+            import cProfile
+            self._sampler = threading.Thread(target=self._sample_stacks, name="profile-sampler", daemon=True)
+            self._sampler.start()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def mark_stage(self, name: str):
+        """Stage hook: record elapsed time and, with --trace-memory, a snapshot."""
+        now = time.perf_counter()
+        self.stage_times.append((name, now - self._last_stage_at))
+        self._last_stage_at = now
+        if self.trace_memory:
+            import tracemalloc
+            self.snapshots.append((name, tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()))
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+        if self.trace_memory:
+            import tracemalloc
+            self.mark_stage("end")
+            tracemalloc.stop()
+
+    def _sample_stacks(self):
+        """Sample every other thread's stack into collapsed 'thread;outer;...;inner' keys."""
+        own_id = threading.get_ident()
+        while not self._stop_sampling.wait(self.SAMPLE_INTERVAL):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                key = ";".join(reversed(stack))
+                self.stack_samples[key] = self.stack_samples.get(key, 0) + 1
+
+    def write_reports(self, directory: str) -> List[str]:
+        """Write all collected reports to directory. Returns the written paths."""
+        os.makedirs(directory, exist_ok=True)
+        written = []
+
+        if self._profiler is not None:
+            import io
+            import pstats
+            pstats_path = os.path.join(directory, "export.pstats")
+            self._profiler.dump_stats(pstats_path)
+            summary = io.StringIO()
+            pstats.Stats(self._profiler, stream=summary).sort_stats("cumulative").print_stats(self.TOP_N)
+            summary_path = os.path.join(directory, "export_pstats.txt")
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                f.write(self._format_stage_times())
+                f.write(summary.getvalue())
+
+            collapsed_path = os.path.join(directory, "export.collapsed")
+            with open(collapsed_path, 'w', encoding='utf-8') as f:
+                for stack, count in sorted(self.stack_samples.items()):
+                    f.write(f"{stack} {count}\n")
+            written.extend([pstats_path, summary_path, collapsed_path])
+
+        if self.snapshots:
+            memory_path = os.path.join(directory, "memory_stages.txt")
+            with open(memory_path, 'w', encoding='utf-8') as f:
+                f.write(self._format_stage_times())
+                previous = None
+                for name, snapshot, (current, peak) in self.snapshots:
+                    f.write(f"\n=== {name}: current {format_bytes(current)}, peak {format_bytes(peak)} ===\n")
+                    if previous is None:
+                        statistics = snapshot.statistics("lineno")
+                        f.write(f"Top {self.TOP_N} allocations:\n")
+                    else:
+                        statistics = snapshot.compare_to(previous, "lineno")
+                        f.write(f"Top {self.TOP_N} allocation changes since previous stage:\n")
+                    for statistic in statistics[:self.TOP_N]:
+                        f.write(f"  {statistic}\n")
+                    previous = snapshot
+            written.append(memory_path)
+
+        return written
+
+    def _format_stage_times(self) -> str:
+        lines = ["Stage timings:"]
+        for name, seconds in self.stage_times:
+            lines.append(f"  {name}: {seconds:.3f}s")
+        lines.append(f"  total: {time.perf_counter() - self._started_at:.3f}s")
+        return "\n".join(lines) + "\n\n"
+
+
+def run_exporter(exporter: PasswordExporter, profiler: Optional[ExportProfiler] = None) -> bool:
+    """Run an exporter, wrapped in the profiler when one is given."""
+    if profiler is None:
+        return exporter.run()
+
+    exporter.stage_hooks.append(profiler.mark_stage)
+    profiler.start()
+    try:
+        success = exporter.run()
+    finally:
+        profiler.stop()
+
+    # --plan promises not to write anything
+    if exporter.plan_only:
+        print("\nProfiling reports are not written with --plan.")
+        return success
+
+    profile_dir = os.path.join(exporter.output_dir, "profile")
+    print("\nProfiling reports:")
+    for path in profiler.write_reports(profile_dir):
+        print(f"  {path}")
+    return success
+
+
+# Content of the attachment stored in the generated test file
+TEST_ATTACHMENT_CONTENT = b"Test receipt\nItem: Test License\nAmount: 19.99\n" * 64
+
+
 def generate_test_file(output_path: str = None) -> str:
     """Generate a dummy .1pux file for testing purposes."""
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -715,7 +3073,8 @@ def generate_test_file(output_path: str = None) -> str:
                                     {"title": "type", "value": "Visa"},
                                     {"title": "number", "value": {"concealed": "4111111111111111"}},
                                     {"title": "cvv", "value": {"concealed": "123"}},
-                                    {"title": "expiry date", "value": {"monthYear": 202612}}
+                                    {"title": "expiry date", "value": {"monthYear": 202612}},
+                                    {"title": "linked login", "value": {"reference": "test_login_006"}}
                                 ]
                             }]
                         }
@@ -760,6 +3119,107 @@ def generate_test_file(output_path: str = None) -> str:
                                 ]
                             }]
                         }
+                    },
+                    # Document item with a file attachment
+                    {
+                        "uuid": "test_document_008",
+                        "favIndex": 0,
+                        "createdAt": 1700000000,
+                        "updatedAt": 1700000000,
+                        "state": "active",
+                        "categoryUuid": "006",
+                        "overview": {
+                            "title": "Purchase Receipt",
+                            "tags": []
+                        },
+                        "details": {
+                            "notesPlain": "Receipt for the test license",
+                            "sections": [{
+                                "title": "Related",
+                                "name": "Section_related",
+                                "fields": [
+                                    {"title": "paid with", "value": {"reference": "test_card_003"}},
+                                    {"title": "store account", "value": {"reference": "test_login_007"}}
+                                ]
+                            }],
+                            "documentAttributes": {
+                                "fileName": "receipt.txt",
+                                "documentId": "testdocument0000000000001",
+                                "decryptedSize": len(TEST_ATTACHMENT_CONTENT)
+                            }
+                        }
+                    }
+                ]
+            }, {
+                "attrs": {
+                    "uuid": "TEST_VAULT_UUID_002",
+                    "name": "Shared Vault",
+                    "desc": "Shared vault with duplicate and reused credentials",
+                    "avatar": "vault-avatar.png",
+                    "type": "U"
+                },
+                "items": [
+                    # Secure Note with a file attachment, exported before the login the receipt references
+                    {
+                        "uuid": "test_note_009",
+                        "favIndex": 0,
+                        "createdAt": 1700000000,
+                        "updatedAt": 1700000000,
+                        "state": "active",
+                        "categoryUuid": "003",
+                        "overview": {
+                            "title": "Receipt Copy",
+                            "tags": []
+                        },
+                        "details": {
+                            "notesPlain": "Shared copy of the test license receipt",
+                            "sections": [{
+                                "title": "Files",
+                                "name": "Section_files",
+                                "fields": [
+                                    {"title": "scan", "value": {"file": {"documentId": "testdocument0000000000002",
+                                                                         "fileName": "receipt_copy.txt"}}}
+                                ]
+                            }]
+                        }
+                    },
+                    # Same login as in Test Vault (exact duplicate across vaults)
+                    {
+                        "uuid": "test_login_006",
+                        "favIndex": 0,
+                        "createdAt": 1700000000,
+                        "updatedAt": 1700000000,
+                        "state": "active",
+                        "categoryUuid": "001",
+                        "overview": {
+                            "title": "Example Website",
+                            "url": "http://example.com/login"
+                        },
+                        "details": {
+                            "loginFields": [
+                                {"value": "User@Example.com", "name": "username", "fieldType": "E", "designation": "username"},
+                                {"value": "SecureTestPass123!", "name": "password", "fieldType": "P", "designation": "password"}
+                            ]
+                        }
+                    },
+                    # Different subdomain, same account and reused password (near-duplicate)
+                    {
+                        "uuid": "test_login_007",
+                        "favIndex": 0,
+                        "createdAt": 1700000000,
+                        "updatedAt": 1700000000,
+                        "state": "active",
+                        "categoryUuid": "001",
+                        "overview": {
+                            "title": "Example Accounts",
+                            "url": "https://accounts.example.com"
+                        },
+                        "details": {
+                            "loginFields": [
+                                {"value": "user@example.com", "name": "username", "fieldType": "E", "designation": "username"},
+                                {"value": "SecureTestPass123!", "name": "password", "fieldType": "P", "designation": "password"}
+                            ]
+                        }
                     }
                 ]
             }]
@@ -777,12 +3237,14 @@ def generate_test_file(output_path: str = None) -> str:
     with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
         zf.writestr('export.attributes', json.dumps(attributes, indent=2))
         zf.writestr('export.data', json.dumps(test_data, indent=2))
+        zf.writestr('files/testdocument0000000000001___receipt.txt', TEST_ATTACHMENT_CONTENT)
+        zf.writestr('files/testdocument0000000000002___receipt_copy.txt', TEST_ATTACHMENT_CONTENT)
 
     print(f"✓ Generated test file: {output_path}")
     return output_path
 
 
-def run_tests() -> bool:
+def run_tests(profiler: Optional[ExportProfiler] = None) -> bool:
     """Run automated tests on the exporter."""
     print("\n" + "="*60)
     print("RUNNING AUTOMATED TESTS")
@@ -798,8 +3260,10 @@ def run_tests() -> bool:
 
         # Run exporter
         print("\n[2/3] Running exporter on test data...")
-        exporter = PasswordExporter(test_file_path)
-        success = exporter.run()
+        # Every attachment counts as large, so --verify checks the preallocated, zero-skipping writes
+        exporter = PasswordExporter(test_file_path, formats=PasswordExporter.OUTPUT_FORMATS, verify=True, sha256=True,
+                                    large_attachment_size=1)
+        success = run_exporter(exporter, profiler)
 
         if not success:
             print("\n✗ TEST FAILED: Export process failed")
@@ -829,6 +3293,97 @@ def run_tests() -> bool:
                 print(f"   Got: {lines[0].strip()}")
                 return False
 
+        # Check the test attachment was extracted
+        if exporter.stats["attachments_extracted"] < 1:
+            print("✗ TEST FAILED: Test attachment was not extracted")
+            return False
+
+        # Check reference fields resolve backwards and forwards across vaults
+        card_dir = os.path.join(non_password_dir, "Credit Card", "Test Visa Card")
+        document_dir = os.path.join(non_password_dir, "Document", "Purchase Receipt")
+        with open(os.path.join(card_dir, "Test Visa Card.txt"), 'r', encoding='utf-8') as f:
+            card_text = f.read()
+        with open(os.path.join(document_dir, "Purchase Receipt.txt"), 'r', encoding='utf-8') as f:
+            document_text = f.read()
+        if ('[Reference: Example Website (Login) - passwords CSV as "Example Website_2"]' not in card_text
+                or "[Reference: Test Visa Card (Credit Card) - non_password_data/Credit Card/Test Visa Card]"
+                not in document_text):
+            print("✗ TEST FAILED: Reference fields were not resolved to linked items")
+            return False
+
+        # Check forward references with default attachment tiers. The receipt's document is written
+        # mid-pass only if its attachment thread finishes after the receipt is handed to the sinks and
+        # before Receipt Copy queues its own attachment, so export a few times to hit that ordering
+        for attempt in range(1, 6):
+            default_dir = os.path.join(outputs_dir, "default_settings", str(attempt))
+            if not PasswordExporter(test_file_path, output_dir=default_dir).run():
+                print("\n✗ TEST FAILED: Export with default settings failed")
+                return False
+            with open(os.path.join(default_dir, "non_password_data", "Document", "Purchase Receipt",
+                                   "Purchase Receipt.txt"), 'r', encoding='utf-8') as f:
+                if '[Reference: Example Accounts (Login) - passwords CSV as "Example Accounts"]' not in f.read():
+                    print("✗ TEST FAILED: Forward reference was not fixed up with default attachment tiers")
+                    return False
+
+        # Check the event journal recorded every export stage and no errors
+        with open(exporter.journal_path, 'r', encoding='utf-8') as f:
+            journal_stages = [json.loads(line)["stage"] for line in f]
+        if exporter.journal or journal_stages[:4] != ["validate", "prepare_outputs", "parse", "export_items"]:
+            print(f"✗ TEST FAILED: Unexpected event journal {journal_stages} ({len(exporter.journal)} errors)")
+            return False
+
+        # Check duplicate detection across vaults
+        duplicate_groups = exporter.stats["duplicate_groups"]
+        for group_type in ["exact_duplicate", "near_duplicate", "reused_password"]:
+            if not duplicate_groups.get(group_type):
+                print(f"✗ TEST FAILED: No {group_type} group detected in test data")
+                return False
+
+        # Check the streaming library API yields the same items without writing anything
+        with ExportReader(test_file_path) as reader:
+            entries = list(reader)
+            logins = [entry for entry in entries if isinstance(entry, ExportRecord)]
+            documents = [entry for entry in entries if isinstance(entry, ExportDocument)]
+            attachment_data = [attachment.read() for document in documents for attachment in document.attachments]
+        if len(logins) != 3 or len(documents) != exporter.stats["non_password_items"]:
+            print(f"✗ TEST FAILED: ExportReader yielded {len(logins)} logins and {len(documents)} documents")
+            return False
+        if attachment_data != [TEST_ATTACHMENT_CONTENT] * 2:
+            print("✗ TEST FAILED: ExportReader attachment content does not match the archive")
+            return False
+
+        # Check user templates compile per category and escape values in HTML
+        note = exporter.build_record("Test Vault", {"uuid": "t", "categoryUuid": "003", "overview": {"title": "A & B"}})
+        template = ItemTemplate("<h1>{{title}}</h1>{{^has_sections}}<p>{{vault}}</p>{{/has_sections}}", ".html")
+        if template.render(note, exporter.record_sections(note), []) != "<h1>A &amp; B</h1><p>Test Vault</p>":
+            print("✗ TEST FAILED: HTML item template rendered incorrectly")
+            return False
+
+        # Check spillable maps read back the same, in insertion order, once moved to SQLite
+        governor = MemoryGovernor(1)
+        spilled = SpillDict(governor, "self_test")
+        for number in range(SpillDict.CHECK_EVERY):
+            spilled.append(f"key{number % 10}", number)
+        spilled["key0"] = ("replaced", 1)
+        spilled_items = list(spilled.items())
+        spilled.close()
+        governor.close()
+        if (not governor.spilled or len(spilled_items) != 10 or spilled_items[0] != ("key0", ["replaced", 1])
+                or spilled_items[1] != ("key1", list(range(1, SpillDict.CHECK_EVERY, 10)))):
+            print("✗ TEST FAILED: Spilled map does not match the values written to it")
+            return False
+
+        # Check the Bitwarden JSON and KeePass XML outputs parse and hold every exported item
+        expected_items = exporter.stats["password_items"] + exporter.stats["non_password_items"]
+        with open(exporter.bitwarden_json_path, 'r', encoding='utf-8') as f:
+            bitwarden_items = len(json.load(f)["items"])
+        import xml.etree.ElementTree as ElementTree
+        keepass_entries = len(ElementTree.parse(exporter.keepass_xml_path).getroot().findall(".//Entry"))
+        if bitwarden_items != expected_items or keepass_entries != expected_items:
+            print(f"✗ TEST FAILED: Expected {expected_items} items, got {bitwarden_items} in Bitwarden JSON "
+                  f"and {keepass_entries} in KeePass XML")
+            return False
+
         # Check non-password data directory exists
         if not os.path.exists(non_password_dir):
             print(f"✗ TEST FAILED: Non-password data directory not found")
@@ -858,8 +3413,8 @@ def run_tests() -> bool:
         return False
 
 
-def cleanup_tests() -> bool:
-    """Clean up test files and outputs."""
+def cleanup_tests(keep_profile: bool = False) -> bool:
+    """Clean up test files and outputs. With keep_profile, outputs/profile/ is left in place."""
     print("\n" + "="*60)
     print("CLEANING UP TEST FILES")
     print("="*60)
@@ -878,12 +3433,22 @@ def cleanup_tests() -> bool:
             cleaned.append(test_file_path)
             print(f"✓ Removed: {test_file_path}")
 
-        # Remove outputs directory
+        # Remove outputs directory (except the profiling reports of a --test-all --profile run)
         if os.path.exists(outputs_dir):
-            import shutil
-            shutil.rmtree(outputs_dir)
-            cleaned.append(outputs_dir)
-            print(f"✓ Removed: {outputs_dir}")
+            if keep_profile:
+                for entry in os.scandir(outputs_dir):
+                    if entry.name == "profile":
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.remove(entry.path)
+                    cleaned.append(entry.path)
+                print(f"✓ Removed: {outputs_dir} (kept profile/)")
+            else:
+                shutil.rmtree(outputs_dir)
+                cleaned.append(outputs_dir)
+                print(f"✓ Removed: {outputs_dir}")
 
         print("\n" + "="*60)
         print(f"✓ CLEANUP COMPLETE: {len(cleaned)} items removed")
@@ -896,6 +3461,132 @@ def cleanup_tests() -> bool:
         return False
 
 
+def format_bytes(size: float) -> str:
+    """Format a byte count for display (e.g. 1.5 MB)."""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte size such as 500000, 64K, 10M or 2G into bytes."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    text = value.strip().upper().rstrip("B")
+    multiplier = 1
+    if text and text[-1] in units:
+        multiplier = units[text[-1]]
+        text = text[:-1]
+    size = int(float(text) * multiplier)
+    if size <= 0:
+        raise ValueError("size must be positive")
+    return size
+
+
+def parse_choice(value: str, choices: List[str]) -> str:
+    """Validate that an option value is one of the allowed choices."""
+    if value.lower() not in choices:
+        raise ValueError(f"expected one of: {', '.join(choices)}")
+    return value.lower()
+
+
+def parse_choice_list(value: str, choices: List[str]) -> List[str]:
+    """Parse a comma-separated list of choices, keeping order and dropping repeats."""
+    selected = []
+    for entry in value.split(","):
+        choice = parse_choice(entry.strip(), choices)
+        if choice not in selected:
+            selected.append(choice)
+    return selected
+
+
+def parse_positive_int(value: str) -> int:
+    """Parse an integer option value that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise ValueError("must be at least 1")
+    return number
+
+
+def parse_positive_float(value: str) -> float:
+    """Parse a number option value that must be greater than 0."""
+    number = float(value)
+    if number <= 0:
+        raise ValueError("must be greater than 0")
+    return number
+
+
+def parse_directory(value: str) -> str:
+    """Parse an option value that must name an existing directory."""
+    if not os.path.isdir(value):
+        raise ValueError("not a directory")
+    return value
+
+
+# Export options accepted after the input file: flag -> (PasswordExporter argument, value parser)
+# A parser of None marks a boolean switch that takes no value.
+EXPORT_OPTIONS = {
+    "--collapse-duplicates": ("collapse_duplicates", None),
+    "--duplicate-report": ("duplicate_report", None),
+    "--shard-by": ("shard_by", lambda value: parse_choice(value, ShardedCsvWriter.SHARD_MODES)),
+    "--shard-size": ("shard_size", parse_size),
+    "--render-workers": ("render_workers", parse_positive_int),
+    "--plan": ("plan_only", None),
+    "--memory-limit": ("memory_limit", parse_size),
+    "--formats": ("formats", lambda value: parse_choice_list(value, PasswordExporter.OUTPUT_FORMATS)),
+    "--verify": ("verify", None),
+    "--sha256": ("sha256", None),
+    "--templates": ("template_dir", parse_directory),
+    "--attachment-workers": ("attachment_workers", parse_positive_int),
+    "--large-attachment-workers": ("large_attachment_workers", parse_positive_int),
+    "--large-attachment-size": ("large_attachment_size", parse_size),
+}
+
+
+# Options accepted by --watch in addition to the export options: flag -> (WatchDaemon argument, value parser)
+WATCH_OPTIONS = {
+    "--jobs": ("jobs", parse_positive_int),
+    "--poll-interval": ("poll_interval", parse_positive_float),
+    "--once": ("once", None),
+}
+
+
+# Flags accepted anywhere on the command line that wrap the export in ExportProfiler
+PROFILE_FLAGS = {"--profile", "--trace-memory"}
+
+
+def parse_export_options(args: List[str], table: Optional[Dict[str, Tuple[str, Any]]] = None) -> Dict[str, Any]:
+    """Parse export options into PasswordExporter keyword arguments. Raises ValueError on bad input."""
+    table = EXPORT_OPTIONS if table is None else table
+    options = {}
+    index = 0
+
+    while index < len(args):
+        flag, _, inline_value = args[index].partition("=")
+        if flag not in table:
+            raise ValueError(f"Unknown option: {args[index]}")
+
+        name, parser = table[flag]
+        if parser is None:
+            if inline_value:
+                raise ValueError(f"Option {flag} does not take a value")
+            options[name] = True
+        else:
+            if not inline_value:
+                index += 1
+                if index >= len(args):
+                    raise ValueError(f"Option {flag} requires a value")
+                inline_value = args[index]
+            try:
+                options[name] = parser(inline_value)
+            except ValueError as e:
+                raise ValueError(f"Invalid value for {flag}: {inline_value} ({str(e)})")
+        index += 1
+
+    return options
+
+
 def main():
     """Main entry point for the script."""
     # Clear console
@@ -905,9 +3596,15 @@ def main():
     print("1Password to Apple Passwords Exporter")
     print("="*60)
 
+    # Profiling flags apply to any export, including the --test path
+    args = [arg for arg in sys.argv[1:] if arg not in PROFILE_FLAGS]
+    profiler = None
+    if len(args) != len(sys.argv) - 1:
+        profiler = ExportProfiler(profile="--profile" in sys.argv, trace_memory="--trace-memory" in sys.argv)
+
     # Check for special commands
-    if len(sys.argv) >= 2:
-        command = sys.argv[1].lower()
+    if len(args) >= 1:
+        command = args[0].lower()
 
         if command == "--generate-test" or command == "-g":
             print("\nGenerating test file...")
@@ -915,18 +3612,49 @@ def main():
             sys.exit(0)
 
         elif command == "--test" or command == "-t":
-            success = run_tests()
+            success = run_tests(profiler)
             sys.exit(0 if success else 1)
 
+        elif command == "--verify" or command == "-v":
+            if len(args) < 2 or args[1].startswith("--"):
+                print("Usage: python3 1password_exporter.py --verify <input_file.1pux> [output_dir] [--sha256]")
+                sys.exit(1)
+            positional = [arg for arg in args[1:] if arg != "--sha256"]
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            output_dir = positional[1] if len(positional) > 1 else os.path.join(script_dir, "outputs")
+            verifier = AttachmentVerifier(positional[0], output_dir, sha256="--sha256" in args)
+            sys.exit(0 if verifier.run() else 1)
+
+        elif command == "--watch" or command == "-w":
+            if profiler is not None:
+                print("Error: --profile and --trace-memory cannot be used with --watch")
+                sys.exit(1)
+            if len(args) < 2 or args[1].startswith("--"):
+                print("Usage: python3 1password_exporter.py --watch <inbox_dir> [output_root] [watch options] [export options]")
+                sys.exit(1)
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            has_output_root = len(args) > 2 and not args[2].startswith("--")
+            output_root = args[2] if has_output_root else os.path.join(script_dir, "outputs", "watch")
+            try:
+                options = parse_export_options(args[3 if has_output_root else 2:], dict(EXPORT_OPTIONS, **WATCH_OPTIONS))
+                if options.get("plan_only"):
+                    raise ValueError("--plan cannot be used with --watch")
+            except ValueError as e:
+                print(f"Error: {str(e)}")
+                sys.exit(1)
+            watch_kwargs = {name: options.pop(name) for name, _ in WATCH_OPTIONS.values() if name in options}
+            daemon = WatchDaemon(args[1], output_root, export_options=options, **watch_kwargs)
+            sys.exit(0 if daemon.run() else 1)
+
         elif command == "--cleanup" or command == "-c":
             success = cleanup_tests()
             sys.exit(0 if success else 1)
 
         elif command == "--test-all" or command == "-a":
             print("\nRunning full test cycle (generate → test → cleanup)...")
-            test_success = run_tests()
+            test_success = run_tests(profiler)
             if test_success:
-                cleanup_tests()
+                cleanup_tests(keep_profile=profiler is not None)
                 print("\n✓ Full test cycle completed successfully!")
                 sys.exit(0)
             else:
@@ -935,32 +3663,77 @@ def main():
 
         elif command in ["--help", "-h", "help"]:
             print("\nUsage:")
-            print("  python3 1password_exporter.py <input_file.1pux>")
+            print("  python3 1password_exporter.py <input_file.1pux> [export options]")
             print("  python3 1password_exporter.py [options]")
             print("\nOptions:")
             print("  --generate-test, -g    Generate dummy test .1pux file")
             print("  --test, -t             Run automated tests")
+            print("  --verify, -v <input_file.1pux> [output_dir] [--sha256]")
+            print("                         Verify an existing output tree's attachments against the archive")
+            print("  --watch, -w <inbox_dir> [output_root] [watch options] [export options]")
+            print("                         Export every .1pux dropped into inbox_dir (default outputs/watch/)")
             print("  --cleanup, -c          Clean up test files and outputs")
             print("  --test-all, -a         Run full test cycle (generate → test → cleanup)")
             print("  --help, -h             Show this help message")
+            print("\nExport options (after the input file):")
+            print("  --collapse-duplicates  Write each identical login (host, username, password) only once")
+            print("                         (unless URL, notes or OTP differ)")
+            print("  --duplicate-report     Write duplicate_report.csv listing duplicate and reused credentials")
+            print("  --shard-by MODE        Split the passwords CSV by rows, bytes, vault or letter (URL host)")
+            print("  --shard-size SIZE      Rows (default 1000) or bytes such as 10M (default) per shard")
+            print("  --render-workers N     Threads extracting item fields ahead of the writers (default 1)")
+            print("  --plan                 Report item counts, disk space and runtime estimate without exporting")
+            print("  --memory-limit SIZE    Memory budget such as 2G; throttles workers and spills indexes to disk")
+            print("  --formats LIST         Outputs written in one pass: apple-csv,text (default), bitwarden, keepass")
+            print("  --verify               After export, check attachment sizes and CRC-32s against the archive")
+            print("  --sha256               With --verify, also write a SHA-256 manifest of the attachments")
+            print("  --templates DIR        Layouts for non-password items: <Category>.<ext> or default.<ext>")
+            print("  --attachment-workers N Threads writing small attachments during the export (default 2)")
+            print("  --large-attachment-workers N")
+            print("                         Threads writing large attachments, largest first, after the items (default 1)")
+            print("  --large-attachment-size SIZE")
+            print("                         Attachments from this size (default 8M) are preallocated and written last")
+            print("\nWatch options (with --watch):")
+            print("  --jobs N               Worker processes kept warm for exports (default 1)")
+            print("  --poll-interval SEC    Seconds between checks when inotify is unavailable (default 2)")
+            print("  --once                 Export the archives already in the inbox, then exit")
+            print("\nProfiling options (with an input file, --test or --test-all):")
+            print("  --profile              Write cProfile stats and flamegraph-ready collapsed stacks")
+            print("  --trace-memory         Write tracemalloc snapshots taken at each export stage")
             print("\nThe script will create in the outputs/ directory:")
             print("  - exported_passwords.csv (for Apple Passwords import)")
+            print("  - duplicate_report.csv (with --duplicate-report)")
+            print("  - bitwarden_export.json / keepass_export.xml (with --formats)")
+            print("  - export_journal.ndjson (stage and error events, one JSON object per line)")
+            print("  - attachment_manifest.json (archive member of every extracted attachment)")
+            print("  - verification_report.json / sha256_manifest.txt (with --verify / --sha256)")
+            print("  - profile/ (with --profile or --trace-memory)")
             print("  - non_password_data/ (organized non-password items)")
             print("    Each item gets its own folder with:")
             print("      • Human-readable .txt file")
             print("      • Any file attachments")
             sys.exit(0)
 
-    if len(sys.argv) < 2:
+    if len(args) < 1:
         print("Usage: python3 1password_exporter.py <input_file.1pux>")
         print("       python3 1password_exporter.py --help for more options")
         sys.exit(1)
 
-    input_file = sys.argv[1]
+    input_file = args[0]
+
+    try:
+        options = parse_export_options(args[1:])
+        exporter = PasswordExporter(input_file, **options)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        print("       python3 1password_exporter.py --help for more options")
+        sys.exit(1)
 
-    exporter = PasswordExporter(input_file)
+    success = run_exporter(exporter, profiler)
 
-    success = exporter.run()
+    if exporter.plan_only:
+        print("\nPlan complete - run without --plan to export." if success else "\nPlan failed. Please check the errors above.")
+        sys.exit(0 if success else 1)
 
     if success:
         print("\nExport completed successfully!")